@@ -1,17 +1,134 @@
 import base64
+import binascii
+from tempfile import SpooledTemporaryFile
 
-from django.core.files.base import ContentFile
+from django.conf import settings
+from django.core import signing
+from django.core.files import File
+from django.core.files.storage import default_storage
+from django.utils.translation import gettext_lazy as _
 from rest_framework import serializers
 
+from PIL import Image, UnidentifiedImageError
+
+# Кратно 4, чтобы каждая часть декодировалась независимо
+BASE64_CHUNK_SIZE = 4 * 64 * 1024
+IMAGE_UPLOAD_SALT = 'api.fields.image_upload'
+
+
+def sign_image_upload(name, user):
+    """Идентификатор картинки, загруженной пользователем заранее"""
+    return signing.dumps(
+        {'name': name, 'user': user.id}, salt=IMAGE_UPLOAD_SALT
+    )
+
 
 class Base64ImageField(serializers.ImageField):
-    """Поле картинки в формате Base64."""
+    """
+    Поле картинки в формате Base64. Размер проверяется по длине строки до
+    декодирования, декодирование идет частями во временный файл, который
+    переносится на диск после FILE_UPLOAD_MAX_MEMORY_SIZE, а формат и
+    размеры картинки определяются только по заголовку файла.
+
+    Также принимает файл из multipart/form-data и идентификатор картинки,
+    загруженной заранее через /api/recipes/images/.
+    """
+
+    default_error_messages = {
+        **serializers.ImageField.default_error_messages,
+        'invalid_base64': _('Некорректная строка Base64.'),
+        'too_large': _('Размер картинки не должен превышать {max_size} байт.'),
+        'too_many_pixels': _(
+            'Картинка не должна содержать больше {max_pixels} пикселей.'
+        ),
+        'invalid_upload': _(
+            'Загруженная картинка не найдена или устарела.'
+        ),
+    }
 
     def to_internal_value(self, data):
         if isinstance(data, str) and data.startswith('data:image'):
-            image_format, image_str = data.split(';base64,')
-            ext = image_format.split('/')[-1]
+            image = self.decode(data)
+            self.check_image(image)
+            # Полная проверка ImageField читает файл в память целиком,
+            # заголовок уже проверен в check_image
+            return serializers.FileField.to_internal_value(self, image)
+        if isinstance(data, str):
+            return self.get_uploaded_name(data)
+        max_size = settings.RECIPE_IMAGE_MAX_SIZE
+        if getattr(data, 'size', 0) > max_size:
+            self.fail('too_large', max_size=max_size)
+        return super().to_internal_value(data)
 
-            data = ContentFile(base64.b64decode(image_str), name='temp.' + ext)
+    def get_uploaded_name(self, handle):
+        """
+        Имя файла в хранилище по идентификатору загрузки. Файл уже
+        сохранен, поэтому модели присваивается только его имя.
+        """
+        try:
+            upload = signing.loads(
+                handle,
+                salt=IMAGE_UPLOAD_SALT,
+                max_age=settings.RECIPE_IMAGE_UPLOAD_MAX_AGE,
+            )
+        except signing.BadSignature:
+            self.fail('invalid_upload')
+        request = self.context.get('request')
+        if (
+            request is None
+            or upload['user'] != request.user.id
+            or not default_storage.exists(upload['name'])
+        ):
+            self.fail('invalid_upload')
+        return upload['name']
 
-        return super().to_internal_value(data)
+    def decode(self, data):
+        _header, separator, image_str = data.partition(';base64,')
+        if not separator:
+            self.fail('invalid_base64')
+        # Переносы строк допустимы в Base64, но мешают делить строку на
+        # части, кратные 4
+        image_str = ''.join(image_str.split())
+        max_size = settings.RECIPE_IMAGE_MAX_SIZE
+        # Размер после декодирования известен заранее по длине строки
+        padding = len(image_str) - len(image_str.rstrip('='))
+        if len(image_str) * 3 // 4 - padding > max_size:
+            self.fail('too_large', max_size=max_size)
+        image_file = SpooledTemporaryFile(
+            max_size=settings.FILE_UPLOAD_MAX_MEMORY_SIZE
+        )
+        try:
+            for start in range(0, len(image_str), BASE64_CHUNK_SIZE):
+                image_file.write(
+                    base64.b64decode(
+                        image_str[start:start + BASE64_CHUNK_SIZE],
+                        validate=True,
+                    )
+                )
+        except binascii.Error:
+            image_file.close()
+            self.fail('invalid_base64')
+        size = image_file.tell()
+        if size > max_size:
+            image_file.close()
+            self.fail('too_large', max_size=max_size)
+        image_file.seek(0)
+        image = File(image_file)
+        image.size = size
+        return image
+
+    def check_image(self, image):
+        """Формат и размеры по заголовку, без декодирования пикселей"""
+        try:
+            with Image.open(image.file) as pillow_image:
+                image_format = pillow_image.format
+                width, height = pillow_image.size
+        except (UnidentifiedImageError, Image.DecompressionBombError):
+            image.close()
+            self.fail('invalid_image')
+        max_pixels = settings.RECIPE_IMAGE_MAX_PIXELS
+        if width * height > max_pixels:
+            image.close()
+            self.fail('too_many_pixels', max_pixels=max_pixels)
+        image.file.seek(0)
+        image.name = f'temp.{image_format.lower()}'
@@ -1,8 +1,40 @@
+from django.conf import settings
+from django.core.cache import cache
 from django.db import models
 import django_filters
 from django_filters import rest_framework as filters
 
-from recipes.models import Ingredient, Recipe
+from recipes.models import Favorite, Ingredient, Recipe, ShoppingCart, Tag
+
+
+def get_tag_map():
+    """
+    Словарь {slug: id} всех тегов. Тегов немного, и меняются они редко,
+    поэтому словарь хранится в кэше и сбрасывается сигналами api.signals.
+    """
+    return cache.get_or_set(
+        settings.TAG_MAP_CACHE_KEY,
+        lambda: dict(Tag.objects.values_list('slug', 'id')),
+        settings.TAG_MAP_TIMEOUT,
+    )
+
+
+def invalidate_tag_map():
+    cache.delete(settings.TAG_MAP_CACHE_KEY)
+
+
+def get_tag_ids(slugs):
+    """
+    id тегов по slug. Кэш в другом процессе мог не узнать о новом теге,
+    поэтому при отсутствии slug в словаре он перечитывается из БД.
+    """
+    tag_map = get_tag_map()
+    if not tag_map.keys() >= set(slugs):
+        tag_map = dict(Tag.objects.values_list('slug', 'id'))
+        cache.set(
+            settings.TAG_MAP_CACHE_KEY, tag_map, settings.TAG_MAP_TIMEOUT
+        )
+    return {tag_map[slug] for slug in slugs if slug in tag_map}
 
 
 class IngredientFilter(filters.FilterSet):
@@ -14,22 +46,21 @@ class IngredientFilter(filters.FilterSet):
     def find_by_name(self, queryset, name, value):
         if not value:
             return queryset
-        # Сначала ищем совпадения по началу слова, аннотируем значением
-        # qs_order=0
-        starts_with = queryset.filter(name__istartswith=value).annotate(
-            qs_order=models.Value(0, models.IntegerField())
-        )
-        # Затем ищем совпадения по любому слову, выкидываем из них совпадения
-        # по началу слова (они у нас уже есть) аннотируем значением
-        # qs_order=1
-
-        contains = (
+        # Один проход по таблице: ищем совпадения по любой части названия,
+        # совпадениям по началу слова ставим qs_order=0, остальным 1.
+        # На PostgreSQL оба условия обслуживает триграммный GIN-индекс
+        # (миграция recipes.0011_ingredient_name_trgm)
+        return (
             queryset.filter(name__icontains=value)
-            .exclude(name__in=starts_with.values('name'))
-            .annotate(qs_order=models.Value(1, models.IntegerField()))
+            .annotate(
+                qs_order=models.Case(
+                    models.When(name__istartswith=value, then=0),
+                    default=1,
+                    output_field=models.IntegerField(),
+                )
+            )
+            .order_by('qs_order', 'name')
         )
-        # Объединяем результаты, сортируя по qs_order
-        return starts_with.union(contains).order_by('qs_order')
 
     class Meta:
         model = Ingredient
@@ -39,36 +70,66 @@ class IngredientFilter(filters.FilterSet):
 class RecipeFilterSet(filters.FilterSet):
     """Фильтр рецептов"""
 
+    # Каждой сортировке соответствует индекс модели Recipe
+    ORDERINGS = {
+        'popular': ('-favorites_count', '-date_added', '-id'),
+        'trending': ('-trending_score', '-date_added', '-id'),
+        'cooking_time': ('cooking_time', '-date_added', '-id'),
+    }
+
     is_favorited = filters.BooleanFilter(method='get_favorite_recipes')
     is_in_shopping_cart = filters.BooleanFilter(method='get_shopping_cart')
     tags = filters.Filter(method='filter_tags')
+    ordering = filters.ChoiceFilter(
+        choices=[(key, key) for key in ORDERINGS], method='order_recipes'
+    )
 
     class Meta:
         model = Recipe
         fields = ('author',)
 
+    def order_recipes(self, queryset, name, value):
+        return queryset.order_by(*self.ORDERINGS[value])
+
     def filter_tags(self, queryset, name, value):
-        tags = self.request.query_params.getlist('tags', None)
-        if tags:
-            queryset = queryset.filter(tags__slug__in=tags).distinct()
-        return queryset  # noqa: R504
+        """
+        Рецепты хотя бы с одним из тегов. Полусоединение EXISTS по
+        промежуточной таблице не размножает строки рецептов, поэтому
+        DISTINCT не нужен и сохраняется сортировка по индексу.
+        """
+        slugs = self.request.query_params.getlist('tags')
+        if not slugs:
+            return queryset
+        tag_ids = get_tag_ids(slugs)
+        if not tag_ids:
+            return queryset.none()
+        return queryset.filter(
+            models.Exists(
+                Recipe.tags.through.objects.filter(
+                    recipe=models.OuterRef('pk'), tag_id__in=tag_ids
+                )
+            )
+        )
+
+    def filter_user_recipes(self, queryset, model):
+        """Рецепты, добавленные пользователем в model"""
+        user = self.request.user
+        if not user.is_authenticated:
+            return queryset.none()
+        return queryset.filter(
+            models.Exists(
+                model.objects.filter(user=user, recipe=models.OuterRef('pk'))
+            )
+        )
 
     def get_favorite_recipes(self, queryset, name, value):
         """Фильтр рецептов, добавленных в избранное."""
         if value:
-            queryset = self.queryset.filter(
-                id__in=self.request.user.favorite_recipes.all().values_list(
-                    'recipe__pk', flat=True
-                )
-            )
-        return queryset  # noqa: R504
+            return self.filter_user_recipes(queryset, Favorite)
+        return queryset
 
     def get_shopping_cart(self, queryset, name, value):
         """Фильтр рецептов, добавленных в список покупок."""
         if value:
-            queryset = self.queryset.filter(
-                id__in=self.request.user.shoppingcart.all().values_list(
-                    'recipe__pk', flat=True
-                )
-            )
-        return queryset  # noqa: R504
+            return self.filter_user_recipes(queryset, ShoppingCart)
+        return queryset
@@ -1,9 +1,14 @@
+from django.db import IntegrityError, transaction
+from django.db.models import Exists, OuterRef
 from django.shortcuts import get_object_or_404
 from django.utils.translation import gettext_lazy as _
 from rest_framework import status
 from rest_framework.response import Response
 
+from api.pagination import KeysetPagination
+from api.serializers import recipe_serializers
 from recipes.models import Recipe
+from recipes.signals import recount_related
 from users.validators import username_validator
 
 
@@ -14,13 +19,16 @@ class FavoriteShoppingCartMixin:
         """Добавляет рецепт"""
         recipe = get_object_or_404(Recipe, id=kwargs['pk'])
         model = kwargs['model']
-        user = request.user
-        if model.objects.filter(user=user, recipe=recipe).exists():
+        # Повторное добавление отсекает уникальный индекс (user, recipe),
+        # так что одновременные запросы не создадут дубликат
+        try:
+            with transaction.atomic():
+                model.objects.create(user=request.user, recipe=recipe)
+        except IntegrityError:
             return Response(
                 {'errors': _('Такой рецепт уже есть')},
                 status=status.HTTP_400_BAD_REQUEST,
             )
-        model.objects.create(user=user, recipe=recipe)
         return Response(
             self.subscribe_serializers_class(recipe).data,
             status=status.HTTP_201_CREATED,
@@ -29,16 +37,118 @@ class FavoriteShoppingCartMixin:
     @staticmethod
     def delete_recipe(request, *args, **kwargs):
         """Удаляет рецепт"""
-        recipe = get_object_or_404(Recipe, id=kwargs['pk'])
         model = kwargs['model']
-        user = request.user
-        if not model.objects.filter(user=user, recipe=recipe).exists():
-            return Response(
-                {'errors': _('Такого рецепта нет')},
-                status=status.HTTP_400_BAD_REQUEST,
+        deleted, _rows = model.objects.filter(
+            user=request.user, recipe_id=kwargs['pk']
+        ).delete()
+        if deleted:
+            return Response(status=status.HTTP_204_NO_CONTENT)
+        # Ничего не удалено: рецепта нет совсем или его нет в списке
+        get_object_or_404(Recipe, id=kwargs['pk'])
+        return Response(
+            {'errors': _('Такого рецепта нет')},
+            status=status.HTTP_400_BAD_REQUEST,
+        )
+
+
+class BulkFavoriteShoppingCartMixin:
+    """Массовое добавление и удаление рецептов избранного и списка покупок"""
+
+    ADDED = 'added'
+    ALREADY_ADDED = 'already_added'
+    REMOVED = 'removed'
+    NOT_ADDED = 'not_added'
+    NOT_FOUND = 'not_found'
+
+    @staticmethod
+    def get_recipe_ids(request):
+        serializer = recipe_serializers.RecipeIdsSerializer(data=request.data)
+        serializer.is_valid(raise_exception=True)
+        return serializer.validated_data['recipes']
+
+    @staticmethod
+    def make_response(recipe_ids, statuses):
+        return Response(
+            {
+                'recipes': [
+                    {'id': recipe_id, 'status': statuses[recipe_id]}
+                    for recipe_id in recipe_ids
+                ]
+            },
+            status=status.HTTP_200_OK,
+        )
+
+    def add_recipes(self, request, model):
+        """
+        Добавляет рецепты из списка id: один запрос для проверки рецептов
+        и один bulk_create. Возвращает результат для каждого id.
+        """
+        recipe_ids = self.get_recipe_ids(request)
+        recipes = Recipe.objects.filter(id__in=recipe_ids).annotate(
+            is_added=Exists(
+                model.objects.filter(user=request.user, recipe=OuterRef('pk'))
+            )
+        )
+        statuses = dict.fromkeys(recipe_ids, self.NOT_FOUND)
+        for recipe_id, is_added in recipes.values_list('id', 'is_added'):
+            statuses[recipe_id] = (
+                self.ALREADY_ADDED if is_added else self.ADDED
             )
-        model.objects.get(user=user, recipe=recipe).delete()
-        return Response(status=status.HTTP_204_NO_CONTENT)
+        added_ids = [
+            recipe_id
+            for recipe_id, recipe_status in statuses.items()
+            if recipe_status == self.ADDED
+        ]
+        model.objects.bulk_create(
+            [model(user=request.user, recipe_id=pk) for pk in added_ids],
+            ignore_conflicts=True,
+        )
+        # bulk_create не отправляет post_save и пропускает строки,
+        # добавленные параллельным запросом, поэтому счетчики
+        # пересчитываются одним запросом
+        recount_related(model, added_ids)
+        return self.make_response(recipe_ids, statuses)
+
+    def delete_recipes(self, request, model):
+        """
+        Удаляет рецепты из списка id одним запросом DELETE. С all: true
+        очищает избранное или список покупок полностью.
+        """
+        serializer = recipe_serializers.RecipeIdsDeleteSerializer(
+            data=request.data
+        )
+        serializer.is_valid(raise_exception=True)
+        user_recipes = model.objects.filter(user=request.user)
+        if serializer.validated_data['all']:
+            deleted, _rows = user_recipes.delete()
+            return Response({'deleted': deleted}, status=status.HTTP_200_OK)
+        recipe_ids = serializer.validated_data['recipes']
+        user_recipes = user_recipes.filter(recipe_id__in=recipe_ids)
+        statuses = dict.fromkeys(recipe_ids, self.NOT_ADDED)
+        statuses.update(
+            dict.fromkeys(
+                user_recipes.values_list('recipe_id', flat=True), self.REMOVED
+            )
+        )
+        user_recipes.delete()
+        return self.make_response(recipe_ids, statuses)
+
+
+class KeysetPaginationMixin:
+    """
+    Пагинация по курсору вместо постраничной, если в запросе передан
+    параметр cursor (см. KeysetPagination.is_requested).
+    """
+
+    keyset_pagination_class = KeysetPagination
+
+    @property
+    def paginator(self):
+        if not hasattr(self, '_paginator') and (
+            self.keyset_pagination_class.is_requested(self.request)
+        ):
+            self._paginator = self.keyset_pagination_class()
+        return super().paginator
 
 
 class ValidateUsername:
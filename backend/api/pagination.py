@@ -1,5 +1,170 @@
-from rest_framework.pagination import PageNumberPagination
+from base64 import urlsafe_b64decode, urlsafe_b64encode
+import binascii
+from datetime import datetime
+from hashlib import sha256
+import json
+
+from django.conf import settings
+from django.core.cache import cache
+from django.core.exceptions import EmptyResultSet, ValidationError
+from django.core.paginator import Paginator
+from django.db import connections
+from django.db.models import Q
+from django.utils.functional import cached_property
+from django.utils.translation import gettext_lazy as _
+from rest_framework.exceptions import NotFound
+from rest_framework.pagination import BasePagination, PageNumberPagination
+from rest_framework.response import Response
+from rest_framework.settings import api_settings
+from rest_framework.utils.urls import remove_query_param, replace_query_param
 
 
 class LimitPagePagination(PageNumberPagination):
     page_size_query_param = 'limit'
+
+
+def estimate_count(queryset):
+    """
+    Оценка числа строк таблицы из статистики PostgreSQL или None, если
+    оценка недоступна или таблица слишком мала, чтобы на ней экономить.
+    """
+    connection = connections[queryset.db]
+    if connection.vendor != 'postgresql':
+        return None
+    with connection.cursor() as cursor:
+        cursor.execute(
+            'SELECT reltuples FROM pg_class WHERE oid = %s::regclass',
+            [queryset.model._meta.db_table],
+        )
+        row = cursor.fetchone()
+    if not row or row[0] < settings.PAGINATION_ESTIMATE_THRESHOLD:
+        return None
+    return int(row[0])
+
+
+class ApproximateCountPaginator(Paginator):
+    """
+    Paginator, который в режиме PAGINATION_COUNT_MODE = 'approximate'
+    не выполняет COUNT(*) на каждый запрос: список без фильтров
+    оценивается по статистике PostgreSQL, остальные количества кэшируются
+    по тексту SQL-запроса, то есть для каждого набора фильтров.
+    """
+
+    @cached_property
+    def count(self):
+        if settings.PAGINATION_COUNT_MODE != 'approximate':
+            return super().count
+        queryset = self.object_list
+        if not queryset.query.where:
+            estimate = estimate_count(queryset)
+            if estimate is not None:
+                return estimate
+        # Ключ не зависит от сортировки и аннотаций, например флагов
+        # избранного, которые различаются у пользователей
+        try:
+            sql = str(queryset.order_by().values('pk').query)
+        except EmptyResultSet:
+            return 0
+        key = sha256(sql.encode()).hexdigest()
+        return cache.get_or_set(
+            f'{settings.PAGINATION_COUNT_PREFIX}:{key}',
+            queryset.count,
+            settings.PAGINATION_COUNT_TIMEOUT,
+        )
+
+
+class ApproximateCountPagination(LimitPagePagination):
+    django_paginator_class = ApproximateCountPaginator
+
+
+class KeysetPagination(BasePagination):
+    """
+    Пагинация по ключу сортировки: курсор хранит значения полей
+    сортировки последнего объекта страницы, следующая страница выбирается
+    условием WHERE по этим значениям. Не выполняет COUNT и OFFSET, поэтому
+    стоимость страницы не зависит от ее номера. Порядок задается атрибутом
+    keyset_ordering вьюсета, последнее поле должно быть уникальным.
+    """
+
+    cursor_query_param = 'cursor'
+    page_size_query_param = 'limit'
+    ordering = ('-date_added', '-id')
+    invalid_cursor_message = _('Неверный курсор.')
+
+    @classmethod
+    def is_requested(cls, request):
+        """
+        Включается параметром cursor (пустым для первой страницы).
+        При явной сортировке ?ordering= остается постраничная пагинация.
+        """
+        params = request.query_params
+        return cls.cursor_query_param in params and 'ordering' not in params
+
+    def get_page_size(self, request):
+        page_size = request.query_params.get(self.page_size_query_param, '')
+        if page_size.isdigit() and int(page_size) > 0:
+            return int(page_size)
+        return api_settings.PAGE_SIZE
+
+    def paginate_queryset(self, queryset, request, view=None):
+        self.request = request
+        self.ordering = getattr(view, 'keyset_ordering', self.ordering)
+        page_size = self.get_page_size(request)
+        queryset = queryset.order_by(*self.ordering)
+        position = self.decode_cursor(request)
+        if position is not None:
+            try:
+                queryset = queryset.filter(self.after(position))
+            except (TypeError, ValueError, ValidationError):
+                raise NotFound(self.invalid_cursor_message)
+        # Лишний объект показывает, есть ли следующая страница
+        page = list(queryset[:page_size + 1])
+        self.has_next = len(page) > page_size
+        self.page = page[:page_size]
+        return self.page
+
+    def after(self, position):
+        """Условие "строго после позиции" для составного ключа"""
+        condition = Q()
+        equal = {}
+        for field, value in zip(self.ordering, position):
+            name = field.lstrip('-')
+            lookup = 'lt' if field.startswith('-') else 'gt'
+            condition |= Q(**equal, **{f'{name}__{lookup}': value})
+            equal[name] = value
+        return condition
+
+    def decode_cursor(self, request):
+        cursor = request.query_params.get(self.cursor_query_param)
+        if not cursor:
+            return None
+        try:
+            position = json.loads(urlsafe_b64decode(cursor.encode('ascii')))
+        except (binascii.Error, UnicodeError, ValueError):
+            raise NotFound(self.invalid_cursor_message)
+        if not isinstance(position, list) or len(position) != len(
+            self.ordering
+        ):
+            raise NotFound(self.invalid_cursor_message)
+        return position
+
+    def encode_cursor(self, obj):
+        position = []
+        for field in self.ordering:
+            value = getattr(obj, field.lstrip('-'))
+            if isinstance(value, datetime):
+                value = value.isoformat()
+            position.append(value)
+        cursor = urlsafe_b64encode(json.dumps(position).encode())
+        return cursor.decode('ascii')
+
+    def get_next_link(self):
+        if not self.has_next:
+            return None
+        url = remove_query_param(self.request.build_absolute_uri(), 'page')
+        return replace_query_param(
+            url, self.cursor_query_param, self.encode_cursor(self.page[-1])
+        )
+
+    def get_paginated_response(self, data):
+        return Response({'next': self.get_next_link(), 'results': data})
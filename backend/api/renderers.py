@@ -0,0 +1,36 @@
+from rest_framework.renderers import BaseRenderer, JSONRenderer
+
+
+class FileRenderer(BaseRenderer):
+    """
+    Базовый рендерер файлов выгрузки. Файлы отдаются готовыми ответами,
+    рендерер нужен для выбора формата через ?format= и Accept, а сообщения
+    об ошибках отдаются как JSON.
+    """
+
+    charset = None
+
+    def render(self, data, accepted_media_type=None, renderer_context=None):
+        if isinstance(data, bytes):
+            return data
+        # Ответ с ошибкой отдается как JSON, а не под типом файла
+        if renderer_context and 'response' in renderer_context:
+            renderer_context['response']['Content-Type'] = (
+                JSONRenderer.media_type
+            )
+        return JSONRenderer().render(data)
+
+
+class PDFRenderer(FileRenderer):
+    media_type = 'application/pdf'
+    format = 'pdf'
+
+
+class CSVRenderer(FileRenderer):
+    media_type = 'text/csv'
+    format = 'csv'
+
+
+class TextRenderer(FileRenderer):
+    media_type = 'text/plain'
+    format = 'txt'
@@ -0,0 +1,83 @@
+import bisect
+import threading
+import time
+
+from django.conf import settings
+
+from api.serializers.recipe_serializers import IngredientSerializer
+from recipes.models import Ingredient
+
+
+class IngredientIndex:
+    """
+    Индекс ингредиентов в памяти процесса для автодополнения по названию.
+
+    Хранит готовые к выдаче словари ингредиентов, отсортированные по имени.
+    Строится при первом поиске, сбрасывается сигналами при изменении
+    Ingredient/Unit (api.signals) и по истечении
+    INGREDIENT_INDEX_TIMEOUT, чтобы подхватить изменения из других процессов.
+    """
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._snapshot = None
+        self._built_at = 0
+
+    def invalidate(self):
+        """Сбрасывает индекс, он будет перестроен при следующем поиске"""
+        self._snapshot = None
+
+    def _is_expired(self):
+        return (
+            time.monotonic() - self._built_at
+            > settings.INGREDIENT_INDEX_TIMEOUT
+        )
+
+    def _build(self):
+        ingredients = Ingredient.objects.select_related(
+            'measurement_unit'
+        ).order_by('name', 'id')
+        items = IngredientSerializer(ingredients, many=True).data
+        names = [ingredient.name for ingredient in ingredients]
+        # Ключи для бинарного поиска по началу названия
+        keys = sorted(
+            (name.lower(), position) for position, name in enumerate(names)
+        )
+        return {
+            'items': items,
+            'lower_names': [name.lower() for name in names],
+            'keys': keys,
+        }
+
+    def _get_snapshot(self):
+        snapshot = self._snapshot
+        if snapshot is not None and not self._is_expired():
+            return snapshot
+        with self._lock:
+            if self._snapshot is None or self._is_expired():
+                self._snapshot = self._build()
+                self._built_at = time.monotonic()
+            return self._snapshot
+
+    def search(self, value):
+        """
+        Ищет ингредиенты по части названия без учета регистра.
+        Сначала идут совпадения по началу названия, затем остальные,
+        внутри групп - по имени, как в api.filters.IngredientFilter.
+        """
+        snapshot = self._get_snapshot()
+        value = value.lower()
+        keys = snapshot['keys']
+        start = bisect.bisect_left(keys, (value,))
+        end = bisect.bisect_left(keys, (value + '\U0010ffff',), lo=start)
+        prefix = sorted(position for _, position in keys[start:end])
+        prefix_set = set(prefix)
+        contains = [
+            position
+            for position, name in enumerate(snapshot['lower_names'])
+            if value in name and position not in prefix_set
+        ]
+        return [snapshot['items'][position] for position in prefix + contains]
+
+
+ingredient_index = IngredientIndex()
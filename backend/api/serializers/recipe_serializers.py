@@ -1,12 +1,15 @@
+import json
+
 from django.conf import settings
+from django.core.files.storage import default_storage
 from django.core.validators import MinValueValidator
-from django.db import IntegrityError
-from django.shortcuts import get_object_or_404
+from django.db import IntegrityError, transaction
 from django.utils.translation import gettext_lazy as _
 from rest_framework import fields, serializers
 from rest_framework.exceptions import ValidationError
+from rest_framework.utils import html
 
-from api.fields import Base64ImageField
+from api.fields import Base64ImageField, sign_image_upload
 from api.serializers import user_serializers
 from recipes.models import (
     Favorite,
@@ -83,7 +86,38 @@ class RecipeIngredientCreateSerializer(BaseIngredientSerializer):
         fields = ('id', 'amount')
 
 
-class RecipeSerializer(serializers.ModelSerializer):
+class RecipeImageVariantsSerializer(serializers.ModelSerializer):
+    """
+    Ссылки на уменьшенные копии картинки рецепта: image_thumb - самая
+    маленькая копия JPEG (или оригинал, пока копии не созданы),
+    image_srcset - значения srcset для каждого формата.
+    """
+
+    image_thumb = fields.SerializerMethodField()
+    image_srcset = fields.SerializerMethodField()
+
+    def build_url(self, name):
+        url = default_storage.url(name)
+        request = self.context.get('request')
+        return request.build_absolute_uri(url) if request else url
+
+    def get_image_thumb(self, obj):
+        variants = obj.image_variants.get('jpeg')
+        if variants:
+            return self.build_url(variants[0][1])
+        return self.build_url(obj.image.name) if obj.image else None
+
+    def get_image_srcset(self, obj):
+        return {
+            extension: ', '.join(
+                f'{self.build_url(name)} {width}w' for width, name in variants
+            )
+            for extension, variants in obj.image_variants.items()
+            if extension != 'source' and variants
+        }
+
+
+class RecipeSerializer(RecipeImageVariantsSerializer):
     """Сериализатор рецептов"""
 
     image = Base64ImageField()
@@ -107,11 +141,18 @@ class RecipeSerializer(serializers.ModelSerializer):
             'is_in_shopping_cart',
             'name',
             'image',
+            'image_thumb',
+            'image_srcset',
             'text',
             'cooking_time',
         )
 
     def get_is_favorited(self, obj):
+        # Рецепты из RecipeViewSet уже аннотированы флагом
+        # (Recipe.objects.with_user_flags), запрос нужен только для
+        # рецептов, полученных в обход вьюсета
+        if hasattr(obj, 'is_favorited'):
+            return obj.is_favorited
         user = self.context['request'].user
         # Проверка на is_authenticated, иначе для анонимов
         # будет ошибка
@@ -121,6 +162,8 @@ class RecipeSerializer(serializers.ModelSerializer):
         )
 
     def get_is_in_shopping_cart(self, obj):
+        if hasattr(obj, 'is_in_shopping_cart'):
+            return obj.is_in_shopping_cart
         user = self.context['request'].user
         # Проверка на is_authenticated, иначе для анонимов
         # будет ошибка
@@ -130,12 +173,19 @@ class RecipeSerializer(serializers.ModelSerializer):
         )
 
 
-class RecipeSubscribeSerializer(serializers.ModelSerializer):
+class RecipeSubscribeSerializer(RecipeImageVariantsSerializer):
     """Укороченный сериализатор рецепта для отображения в подписках"""
 
     class Meta:
         model = Recipe
-        fields = ('id', 'name', 'image', 'cooking_time')
+        fields = (
+            'id',
+            'name',
+            'image',
+            'image_thumb',
+            'image_srcset',
+            'cooking_time',
+        )
 
 
 class RecipeCreateSerializer(RecipeSerializer):
@@ -156,6 +206,23 @@ class RecipeCreateSerializer(RecipeSerializer):
             'cooking_time',
         )
 
+    def to_internal_value(self, data):
+        # В multipart/form-data ингредиенты передаются JSON-строкой,
+        # а теги - повторяющимся полем tags
+        if html.is_html_input(data) and 'ingredients' in data:
+            try:
+                ingredients = json.loads(data['ingredients'])
+            except ValueError:
+                raise ValidationError(
+                    {'ingredients': [_('Ожидается JSON-список ингредиентов.')]}
+                )
+            data = {
+                **data.dict(),
+                'ingredients': ingredients,
+                'tags': data.getlist('tags'),
+            }
+        return super().to_internal_value(data)
+
     def validate(self, data):
         if 'ingredients' not in data:
             raise serializers.ValidationError(
@@ -172,12 +239,23 @@ class RecipeCreateSerializer(RecipeSerializer):
         return data
 
     def validate_ingredients(self, value):
-        """Проверка, что ингредиент не повторяется"""
+        """
+        Проверка, что ингредиент не повторяется и существует. Все
+        ингредиенты проверяются одним запросом до записи рецепта.
+        """
         ingredients_ids = [ingredient['id'] for ingredient in value]
         if len(ingredients_ids) != len(set(ingredients_ids)):
             raise serializers.ValidationError(
                 _('Ингредиенты не должны повторяться.')
             )
+        found = Ingredient.objects.only('id').in_bulk(ingredients_ids)
+        missing = [pk for pk in ingredients_ids if pk not in found]
+        if missing:
+            raise serializers.ValidationError(
+                _('Ингредиенты не найдены: {ids}.').format(
+                    ids=', '.join(map(str, missing))
+                )
+            )
         return value
 
     def validate_cooking_time(self, value):
@@ -201,13 +279,13 @@ class RecipeCreateSerializer(RecipeSerializer):
 
     def create_ingredients(self, recipe, ingredients):
         """Создает ингредиенты для рецепта"""
+        if not ingredients:
+            return
         try:
             RecipeIngredient.objects.bulk_create(
                 RecipeIngredient(
                     recipe=recipe,
-                    ingredient=get_object_or_404(
-                        Ingredient, id=ingredient['id']
-                    ),
+                    ingredient_id=ingredient['id'],
                     amount=ingredient['amount'],
                 )
                 for ingredient in ingredients
@@ -217,6 +295,7 @@ class RecipeCreateSerializer(RecipeSerializer):
                 _(f'Ошибка при добавлении ингредиента: {error}')
             )
 
+    @transaction.atomic
     def create(self, validated_data):
         author = self.context.get('request').user
         ingredients = validated_data.pop('ingredients')
@@ -226,19 +305,109 @@ class RecipeCreateSerializer(RecipeSerializer):
         self.create_ingredients(recipe, ingredients)
         return recipe
 
+    def update_ingredients(self, recipe, ingredients):
+        """
+        Приводит ингредиенты рецепта к переданным: добавляет новые,
+        меняет количество у изменившихся и удаляет лишние, не трогая
+        строки без изменений.
+        """
+        amounts = {item['id']: item['amount'] for item in ingredients}
+        existing = {
+            row.ingredient_id: row for row in recipe.recipe_ingredients.all()
+        }
+        removed = [
+            row.pk for pk, row in existing.items() if pk not in amounts
+        ]
+        changed = []
+        for pk, row in existing.items():
+            if pk in amounts and row.amount != amounts[pk]:
+                row.amount = amounts[pk]
+                changed.append(row)
+        if removed:
+            RecipeIngredient.objects.filter(pk__in=removed).delete()
+        if changed:
+            RecipeIngredient.objects.bulk_update(changed, ['amount'])
+        self.create_ingredients(
+            recipe,
+            [item for item in ingredients if item['id'] not in existing],
+        )
+
+    @transaction.atomic
     def update(self, recipe, validated_data):
         ingredients = validated_data.pop('ingredients')
         tags = validated_data.pop('tags')
         super().update(recipe, validated_data)
-        recipe.ingredients.clear()
+        # set() меняет только добавленные и удаленные теги
         recipe.tags.set(tags)
-        self.create_ingredients(recipe, ingredients)
+        self.update_ingredients(recipe, ingredients)
         return recipe
 
     def to_representation(self, recipe):
-        return RecipeSerializer(
-            recipe, context={'request': self.context['request']}
-        ).data
+        request = self.context['request']
+        # Перечитываем рецепт: кэш prefetch_related после записи
+        # ингредиентов и тегов устарел
+        recipe = (
+            Recipe.objects.with_related()
+            .with_user_flags(request.user)
+            .get(pk=recipe.pk)
+        )
+        return RecipeSerializer(recipe, context={'request': request}).data
+
+
+class RecipeIdsSerializer(serializers.Serializer):
+    """Список id рецептов для массового добавления и удаления"""
+
+    recipes = serializers.ListField(
+        child=serializers.IntegerField(min_value=1),
+        allow_empty=False,
+        max_length=settings.BULK_RECIPES_MAX_LENGTH,
+    )
+
+    def validate_recipes(self, value):
+        # Повторяющиеся id обрабатываются один раз, порядок сохраняется
+        return list(dict.fromkeys(value))
+
+
+class RecipeIdsDeleteSerializer(RecipeIdsSerializer):
+    """
+    Список id рецептов для массового удаления или all: true для очистки
+    всего списка. Очистка выполняется только по явному флагу.
+    """
+
+    recipes = serializers.ListField(
+        child=serializers.IntegerField(min_value=1),
+        allow_empty=False,
+        max_length=settings.BULK_RECIPES_MAX_LENGTH,
+        required=False,
+    )
+    all = serializers.BooleanField(default=False)
+
+    def validate(self, data):
+        if data['all'] == ('recipes' in data):
+            raise ValidationError(
+                _('Передайте либо список recipes, либо all: true.')
+            )
+        return data
+
+
+class RecipeImageUploadSerializer(serializers.Serializer):
+    """Загрузка картинки рецепта отдельно от данных рецепта"""
+
+    image = Base64ImageField()
+
+    def create(self, validated_data):
+        image = validated_data['image']
+        name = Recipe._meta.get_field('image').generate_filename(
+            None, image.name
+        )
+        return default_storage.save(name, image)
+
+    def to_representation(self, name):
+        request = self.context['request']
+        return {
+            'image': sign_image_upload(name, request.user),
+            'url': request.build_absolute_uri(default_storage.url(name)),
+        }
 
 
 class FavoriteRecipeSerializer(serializers.ModelSerializer):
@@ -8,12 +8,27 @@ from api.serializers.user_serializers import UserSerializer
 class SubscriptionSerializer(UserSerializer):
     """Сериализатор подписок на пользователей."""
 
-    recipes = RecipeSubscribeSerializer(many=True)
-    recipes_count = SerializerMethodField()
+    recipes = SerializerMethodField()
     pagination_class = LimitPagePagination
 
-    def get_recipes_count(self, obj):
-        return obj.recipes.count()
+    @staticmethod
+    def get_recipes_limit(request):
+        """Возвращает значение параметра recipes_limit или None"""
+        recipes_limit = request.query_params.get('recipes_limit', '')
+        if recipes_limit.isdigit() and int(recipes_limit) > 0:
+            return int(recipes_limit)
+        return None
+
+    def get_recipes(self, obj):
+        # В списке подписок рецепты уже подгружены и ограничены в БД
+        # (UserViewSet.subscriptions), срез нужен для одиночной подписки
+        recipes = obj.recipes.all()
+        recipes_limit = self.get_recipes_limit(self.context['request'])
+        if recipes_limit:
+            recipes = recipes[:recipes_limit]
+        return RecipeSubscribeSerializer(
+            recipes, many=True, context=self.context
+        ).data
 
     class Meta(UserSerializer.Meta):
         fields = UserSerializer.Meta.fields + ('recipes', 'recipes_count')
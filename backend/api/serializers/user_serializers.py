@@ -53,16 +53,28 @@ class UserSerializer(BaseUserSerializer):
 
     is_subscribed = SerializerMethodField(read_only=True)
 
+    def get_subscribed_ids(self):
+        """
+        Возвращает множество id авторов, на которых подписан юзер.
+        Загружается одним запросом и кэшируется на объекте запроса, чтобы
+        все сериализаторы пользователей в ответе использовали его повторно.
+        """
+        request = self.context['request']
+        if not hasattr(request, '_subscribed_ids'):
+            request._subscribed_ids = set(
+                request.user.subscriptions.values_list(
+                    'subscription_id', flat=True
+                )
+            )
+        return request._subscribed_ids
+
     def get_is_subscribed(self, obj):
         user = self.context['request'].user
         # Проверяет есть ли у юзера в подписках автор из
         # сериализатора (запроса)
         # Проверка на is_authenticated нужна, иначе для анонимов
         # будет ошибка
-        return (
-            user.is_authenticated
-            and user.subscriptions.filter(subscription=obj).exists()
-        )
+        return user.is_authenticated and obj.id in self.get_subscribed_ids()
 
     class Meta(BaseUserSerializer.Meta):
         fields = BaseUserSerializer.Meta.fields + ('is_subscribed',)
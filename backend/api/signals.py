@@ -0,0 +1,22 @@
+from django.db.models.signals import post_delete, post_save
+from django.dispatch import receiver
+
+from api.filters import invalidate_tag_map
+from api.search import ingredient_index
+from recipes.models import Ingredient, Tag, Unit
+
+
+@receiver(post_save, sender=Ingredient)
+@receiver(post_delete, sender=Ingredient)
+@receiver(post_save, sender=Unit)
+@receiver(post_delete, sender=Unit)
+def invalidate_ingredient_index(**kwargs):
+    """Сбрасывает индекс поиска ингредиентов при изменении каталога"""
+    ingredient_index.invalidate()
+
+
+@receiver(post_save, sender=Tag)
+@receiver(post_delete, sender=Tag)
+def invalidate_tags(**kwargs):
+    """Сбрасывает словарь тегов фильтра рецептов"""
+    invalidate_tag_map()
@@ -1,13 +1,21 @@
-from rest_framework import mixins, permissions, viewsets
+from rest_framework import mixins, permissions, status, viewsets
 from rest_framework.decorators import action
+from rest_framework.parsers import FormParser, MultiPartParser
+from rest_framework.response import Response
 
 from api.filters import IngredientFilter, RecipeFilterSet
-from api.mixins import FavoriteShoppingCartMixin
-from api.pagination import LimitPagePagination
+from api.mixins import (
+    BulkFavoriteShoppingCartMixin,
+    FavoriteShoppingCartMixin,
+    KeysetPaginationMixin,
+)
+from api.pagination import ApproximateCountPagination
 from api.permissions import IsAdminAuthorOrReadOnly
+from api.search import ingredient_index
 from api.serializers.recipe_serializers import (
     IngredientSerializer,
     RecipeCreateSerializer,
+    RecipeImageUploadSerializer,
     RecipeSerializer,
     RecipeSubscribeSerializer,
     TagSerializer,
@@ -23,19 +31,32 @@ class TagIngredientBaseViewSet(
     pagination_class = None
 
 
-class RecipeViewSet(viewsets.ModelViewSet, FavoriteShoppingCartMixin):
+class RecipeViewSet(
+    KeysetPaginationMixin,
+    viewsets.ModelViewSet,
+    FavoriteShoppingCartMixin,
+    BulkFavoriteShoppingCartMixin,
+):
     """Вьюсет для рецептов"""
 
     serializer_class = RecipeSerializer
     create_serializer_class = RecipeCreateSerializer
+    upload_image_serializer_class = RecipeImageUploadSerializer
     subscribe_serializers_class = RecipeSubscribeSerializer
-    queryset = Recipe.objects.select_related('author').all()
-    pagination_class = LimitPagePagination
+    queryset = Recipe.objects.with_related()
+    pagination_class = ApproximateCountPagination
+    keyset_ordering = ('-date_added', '-id')
     filterset_class = RecipeFilterSet
     permission_classes = (IsAdminAuthorOrReadOnly,)
 
+    def get_queryset(self):
+        """Рецепты с флагами избранного и списка покупок для пользователя"""
+        return super().get_queryset().with_user_flags(self.request.user)
+
     def get_serializer_class(self):
         """Возвращает нужный сериализатор в зависимости от http-метода"""
+        if self.action == 'upload_image':
+            return self.upload_image_serializer_class
         if self.request.method in permissions.SAFE_METHODS:
             return self.serializer_class
         return self.create_serializer_class
@@ -52,6 +73,37 @@ class RecipeViewSet(viewsets.ModelViewSet, FavoriteShoppingCartMixin):
         # Удаление рецепта из избранного
         return self.delete_recipe(request, pk=pk, model=Favorite)
 
+    @action(
+        methods=('post', 'delete'),
+        detail=False,
+        url_path='favorite',
+        url_name='favorite_bulk',
+        permission_classes=(permissions.IsAuthenticated,),
+    )
+    def favorite_bulk(self, request):
+        """Массовое добавление и удаление рецептов избранного"""
+        if request.method == 'POST':
+            return self.add_recipes(request, Favorite)
+        return self.delete_recipes(request, Favorite)
+
+    @action(
+        methods=('post',),
+        detail=False,
+        url_path='images',
+        url_name='image_upload',
+        parser_classes=(MultiPartParser, FormParser),
+        permission_classes=(permissions.IsAuthenticated,),
+    )
+    def upload_image(self, request):
+        """
+        Загрузка картинки файлом. Возвращает идентификатор, который
+        передается в поле image рецепта вместо строки Base64.
+        """
+        serializer = self.get_serializer(data=request.data)
+        serializer.is_valid(raise_exception=True)
+        serializer.save()
+        return Response(serializer.data, status=status.HTTP_201_CREATED)
+
 
 class TagViewSet(TagIngredientBaseViewSet):
     """Вьюсет тегов."""
@@ -66,3 +118,10 @@ class IngredientViewSet(TagIngredientBaseViewSet):
     serializer_class = IngredientSerializer
     queryset = Ingredient.objects.select_related('measurement_unit').all()
     filterset_class = IngredientFilter
+
+    def list(self, request, *args, **kwargs):
+        """Поиск по названию обслуживается индексом в памяти без SQL"""
+        name = request.query_params.get('name')
+        if name:
+            return Response(ingredient_index.search(name))
+        return super().list(request, *args, **kwargs)
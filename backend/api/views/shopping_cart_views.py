@@ -1,19 +1,31 @@
-from django.db.models import Sum
-from django.db.models.functions import Lower
-from django.http import HttpResponse
+from django.http import HttpResponse, StreamingHttpResponse
+from django.utils.translation import gettext_lazy as _
 from rest_framework import permissions, status, viewsets
 from rest_framework.decorators import action
 from rest_framework.response import Response
 
-from api.mixins import FavoriteShoppingCartMixin
+from api.mixins import BulkFavoriteShoppingCartMixin, FavoriteShoppingCartMixin
+from api.renderers import CSVRenderer, PDFRenderer, TextRenderer
 from api.serializers.recipe_serializers import RecipeSubscribeSerializer
-from core.generate_pdf import PDFFile
+from core.generate_pdf import get_pdf_content
+from core.generate_text import generate_csv, generate_text
 from recipes.models import ShoppingCart
+from recipes.services import get_shopping_cart_ingredients
 
 
-class ShoppingCartViewSet(viewsets.GenericViewSet, FavoriteShoppingCartMixin):
+class ShoppingCartViewSet(
+    viewsets.GenericViewSet,
+    FavoriteShoppingCartMixin,
+    BulkFavoriteShoppingCartMixin,
+):
     """Вьюсет для списка покупок"""
 
+    # Потоковые форматы выгрузки: формат -> (генератор, имя файла)
+    STREAMING_EXPORTS = {
+        CSVRenderer.format: (generate_csv, 'shopping_cart.csv'),
+        TextRenderer.format: (generate_text, 'shopping_cart.txt'),
+    }
+
     subscribe_serializers_class = RecipeSubscribeSerializer
     queryset = ShoppingCart.objects.all()
 
@@ -30,46 +42,60 @@ class ShoppingCartViewSet(viewsets.GenericViewSet, FavoriteShoppingCartMixin):
         # Удаление рецепта из избранного
         return self.delete_recipe(request, pk=pk, model=ShoppingCart)
 
+    @action(
+        methods=('post', 'delete'),
+        detail=False,
+        url_path='shopping_cart',
+        url_name='shopping_cart_bulk',
+        permission_classes=(permissions.IsAuthenticated,),
+    )
+    def shopping_cart_bulk(self, request):
+        """Массовое добавление и удаление рецептов списка покупок"""
+        if request.method == 'POST':
+            return self.add_recipes(request, ShoppingCart)
+        return self.delete_recipes(request, ShoppingCart)
+
     @action(
         methods=('get',),
         detail=False,
         permission_classes=(permissions.IsAuthenticated,),
+        renderer_classes=(PDFRenderer, CSVRenderer, TextRenderer),
     )
     def download_shopping_cart(self, request):
-        # Bug @ Django 3.2. Без указания order_by() ORM добавляет
-        # принудительно GROUP BY recipes_recipe.date_added и из-за этого
-        # ингредиенты не группируются по имени.
-        # https://code.djangoproject.com/ticket/14357
-        #
-        try:
-            cart = (
-                request.user.shoppingcart.select_related('recipe_ingredients')
-                .values(
-                    'recipe__ingredients__name',
-                    'recipe__ingredients__measurement_unit__name',
-                )
-                .annotate(sum=Sum('recipe__recipe_ingredients__amount'))
-                .order_by(Lower('recipe__ingredients__name'))
-            )
-        except Exception as error:
+        """
+        Выгрузка списка покупок. Формат выбирается параметром
+        ?format=pdf|csv|txt (по умолчанию PDF) или заголовком Accept.
+        """
+        cart = get_shopping_cart_ingredients(request.user)
+        if not cart.exists():
             return Response(
-                {'errors': str(error)}, status=status.HTTP_400_BAD_REQUEST
+                {'errors': _('Список покупок пуст')},
+                status=status.HTTP_400_BAD_REQUEST,
             )
-
-        pdf_file = PDFFile()
-        # Добавляем ингредиенты в PDF, имена предварительно капитализируем
-        for ingredient in cart:
-            pdf_file.add_item(
-                [
-                    ingredient['recipe__ingredients__name'].capitalize(),
-                    ingredient['sum'],
-                    ingredient['recipe__ingredients__measurement_unit__name'],
-                ]
+        # Имена ингредиентов предварительно капитализируем. iterator()
+        # читает строки курсором на стороне сервера БД, не загружая весь
+        # список в память
+        items = (
+            [
+                ingredient['name'].capitalize(),
+                ingredient['amount'],
+                ingredient['measurement_unit'],
+            ]
+            for ingredient in cart.iterator()
+        )
+        renderer = request.accepted_renderer
+        if renderer.format in self.STREAMING_EXPORTS:
+            generate, filename = self.STREAMING_EXPORTS[renderer.format]
+            response = StreamingHttpResponse(
+                generate(items),
+                content_type=f'{renderer.media_type}; charset=utf-8',
+            )
+            response['Content-Disposition'] = (
+                f'attachment; filename="{filename}"'
             )
-        if not pdf_file.get_content():
-            return Response(status=status.HTTP_400_BAD_REQUEST)
+            return response
         return HttpResponse(
-            pdf_file.get_content(),
-            content_type='application/pdf',
+            get_pdf_content(list(items)),
+            content_type=renderer.media_type,
             status=status.HTTP_200_OK,
         )
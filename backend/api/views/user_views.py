@@ -1,5 +1,6 @@
 from django.contrib.auth import get_user_model
 from django.core.exceptions import ValidationError
+from django.db.models import Prefetch
 from django.shortcuts import get_object_or_404
 from django.utils.translation import gettext_lazy as _
 from djoser.views import UserViewSet as DjoserUsers
@@ -8,18 +9,22 @@ from rest_framework.decorators import action
 from rest_framework.response import Response
 from rest_framework.views import APIView
 
+from api.mixins import KeysetPaginationMixin
 from api.pagination import LimitPagePagination
 from api.serializers.subscribe_serializers import SubscriptionSerializer
 from api.utils import get_subscription_serializer
+from recipes.models import Recipe
 from users.models import Subscription
 
 User = get_user_model()
 
 
-class UserViewSet(DjoserUsers):
+class UserViewSet(KeysetPaginationMixin, DjoserUsers):
     """Пользователи на основе Djoser."""
 
     pagination_class = LimitPagePagination
+    # Курсор по id в порядке User.Meta.ordering
+    keyset_ordering = ('-id',)
     http_method_names = ('get', 'post', 'head')
 
     @action(
@@ -31,7 +36,14 @@ class UserViewSet(DjoserUsers):
         """Список подписок пользователя."""
 
         # https://stackoverflow.com/questions/31785966/django-rest-framework-turn-on-pagination-on-a-viewset-like-modelviewset-pagina
-        queryset = User.objects.filter(subscribers__user=request.user)
+        recipes = Recipe.objects.all()
+        recipes_limit = SubscriptionSerializer.get_recipes_limit(request)
+        if recipes_limit:
+            recipes = recipes.latest_per_author(recipes_limit)
+        queryset = (
+            User.objects.filter(subscribers__user=request.user)
+            .prefetch_related(Prefetch('recipes', queryset=recipes))
+        )
         page = self.paginate_queryset(queryset)
         if page is not None:
             return self.get_paginated_response(
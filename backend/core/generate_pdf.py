@@ -1,11 +1,15 @@
+from hashlib import sha256
 from io import BytesIO
+import json
+import threading
 
 from django.conf import settings
+from django.core.cache import cache
 
-from reportlab.lib import colors, styles
+from reportlab.lib import colors
 from reportlab.lib.enums import TA_LEFT
 from reportlab.lib.pagesizes import A4
-from reportlab.lib.styles import ParagraphStyle
+from reportlab.lib.styles import ParagraphStyle, getSampleStyleSheet
 from reportlab.lib.units import mm
 from reportlab.pdfbase.pdfmetrics import registerFont, registerFontFamily
 from reportlab.pdfbase.ttfonts import TTFont
@@ -23,70 +27,113 @@ class PDFFile:
         f'{FONT_FAMILY}-BoldItalic': f'{FONT_FAMILY}-BoldItalic.ttf',
     }
 
+    title = 'Продуктовый помощник'
+    author = 'Roman Petrakov'
+    subject = 'Список покупок'
+    page_size = A4
+    left_margin = 10 * mm
+    right_margin = 10 * mm
+    top_margin = 10 * mm
+    bottom_margin = 10 * mm
+    space_before = 12
+    footer_height = 30 * mm
+    body_fontsize = 12
+    header_fontsize = 16
+    footer_fontsize = 12
+    offset_multiplier = 2
+    leading_add = 1
+    font_path = settings.BASE_DIR / 'core' / 'static' / 'fonts'
+
+    # Фонты и стили общие для всех файлов процесса: регистрируются и
+    # создаются один раз при первом создании файла
+    _setup_lock = threading.Lock()
+    _fonts_registered = False
+    _styles = None
+    _table_style = None
+
     def __init__(self):
-        self.title = 'Продуктовый помощник'
-        self.author = 'Roman Petrakov'
-        self.subject = 'Список покупок'
-        self.page_size = A4
-        self.left_margin = 10 * mm
-        self.right_margin = 10 * mm
-        self.top_margin = 10 * mm
-        self.bottom_margin = 10 * mm
-        self.space_before = 12
-        self.footer_height = 30 * mm
-        self.body_fontsize = 12
-        self.header_fontsize = 16
-        self.footer_fontsize = 12
-        self.offset_multiplier = 2
-        self.leading_add = 1
-        # инициализация стилей reportlab и установка их в дефолтное значение
-        self.styles = styles.getSampleStyleSheet()
-        self.set_styles()
-        # регистрация фонтов
-        self.font_path = settings.BASE_DIR / 'core' / 'static' / 'fonts'
-        self.register_fonts()
+        self.setup()
 
         self.pdf_file = None
         self.items = []
 
-    def register_fonts(self):
+    @classmethod
+    def setup(cls):
+        """Однократная регистрация фонтов и создание стилей"""
+        if cls._fonts_registered:
+            return
+        with cls._setup_lock:
+            if cls._fonts_registered:
+                return
+            cls.register_fonts()
+            # инициализация стилей reportlab и установка их в дефолтное
+            # значение
+            cls._styles = getSampleStyleSheet()
+            cls.set_styles()
+            cls._table_style = TableStyle(
+                [
+                    (
+                        'FONTNAME',
+                        (0, 0),
+                        (-1, -1),
+                        f'{cls.FONT_FAMILY}-Regular',
+                    ),
+                    ('FONTSIZE', (0, 0), (-1, -1), cls.body_fontsize),
+                    (
+                        'LEADING',
+                        (0, 0),
+                        (-1, -1),
+                        cls.body_fontsize + cls.leading_add,
+                    ),
+                ]
+            )
+            cls._fonts_registered = True
+
+    @classmethod
+    def register_fonts(cls):
         """Загрузка и регистрация TTF фонтов"""
-        for font_variant, font_file in self.FONT.items():
-            registerFont(TTFont(font_variant, self.font_path / font_file))
+        for font_variant, font_file in cls.FONT.items():
+            registerFont(TTFont(font_variant, cls.font_path / font_file))
 
         registerFontFamily(
-            self.FONT_FAMILY,
-            normal=f'{self.FONT_FAMILY}-Regular',
-            bold=f'{self.FONT_FAMILY}-Bold',
-            italic=f'{self.FONT_FAMILY}-Italic',
-            boldItalic=f'{self.FONT_FAMILY}-BoldItalic',
+            cls.FONT_FAMILY,
+            normal=f'{cls.FONT_FAMILY}-Regular',
+            bold=f'{cls.FONT_FAMILY}-Bold',
+            italic=f'{cls.FONT_FAMILY}-Italic',
+            boldItalic=f'{cls.FONT_FAMILY}-BoldItalic',
         )
 
-    def set_styles(self):
+    @classmethod
+    def set_styles(cls):
         """Задание стилей"""
-        self.styles.add(
+        cls._styles.add(
             ParagraphStyle(
                 name='regular',
-                fontName=f'{self.FONT_FAMILY}-Regular',
-                fontSize=self.body_fontsize,
-                leading=self.body_fontsize + self.leading_add,
-                spaceBefore=self.space_before,
-                spaceAfter=self.space_before // self.offset_multiplier,
+                fontName=f'{cls.FONT_FAMILY}-Regular',
+                fontSize=cls.body_fontsize,
+                leading=cls.body_fontsize + cls.leading_add,
+                spaceBefore=cls.space_before,
+                spaceAfter=cls.space_before // cls.offset_multiplier,
                 alignment=TA_LEFT,
             )
         )
-        self.styles.add(
+        cls._styles.add(
             ParagraphStyle(
                 name='footer',
-                fontName=f'{self.FONT_FAMILY}-Bold',
-                fontSize=self.body_fontsize,
-                leading=self.body_fontsize + self.leading_add,
-                spaceBefore=self.space_before,
-                spaceAfter=self.space_before // self.offset_multiplier,
+                fontName=f'{cls.FONT_FAMILY}-Bold',
+                fontSize=cls.body_fontsize,
+                leading=cls.body_fontsize + cls.leading_add,
+                spaceBefore=cls.space_before,
+                spaceAfter=cls.space_before // cls.offset_multiplier,
                 alignment=TA_LEFT,
             )
         )
 
+    @property
+    def styles(self):
+        """Возвращает общую таблицу стилей"""
+        return self._styles
+
     @property
     def regular_style(self):
         """Возвращает стиль основной страницы"""
@@ -100,18 +147,7 @@ class PDFFile:
     @property
     def table_style(self):
         """Возвращает стиль таблицы"""
-        return TableStyle(
-            [
-                ('FONTNAME', (0, 0), (-1, -1), f'{self.FONT_FAMILY}-Regular'),
-                ('FONTSIZE', (0, 0), (-1, -1), self.body_fontsize),
-                (
-                    'LEADING',
-                    (0, 0),
-                    (-1, -1),
-                    self.body_fontsize + self.leading_add,
-                ),
-            ]
-        )
+        return self._table_style
 
     def add_item(self, item):
         """Метод для добавления элементов файла"""
@@ -166,6 +202,8 @@ class PDFFile:
 
     def create(self):
         """Создание файла, заполнение шаблона"""
+        if not self.items:
+            return None
         buffer = BytesIO()
         pdf_file = SimpleDocTemplate(
             buffer,
@@ -180,18 +218,33 @@ class PDFFile:
         )
         # Создание файла из таблицы, используя шаблоны первой и последующих
         # страниц
-        if self.generate_table() is None:
-            return None
         pdf_file.build(
             self.generate_table(),
             onFirstPage=self.template_first_page,
             onLaterPages=self.template_later_pages,
         )
-        buffer.seek(0)
-        pdf = buffer.getvalue()
-        buffer.close()
-        return pdf  # noqa: R504
+        return buffer.getvalue()
 
     def get_content(self):
         """Метод для сохранения файла"""
         return self.create()
+
+
+def get_pdf_content(items):
+    """
+    Возвращает PDF-файл с таблицей из элементов. Готовые файлы кэшируются
+    по хэшу содержимого, поэтому повторная выгрузка неизменного списка не
+    перерисовывает документ, а любое изменение списка меняет ключ кэша.
+    """
+    content_hash = sha256(
+        json.dumps(items, ensure_ascii=False, default=str).encode()
+    ).hexdigest()
+    cache_key = f'{settings.PDF_CACHE_PREFIX}:{content_hash}'
+    content = cache.get(cache_key)
+    if content is None:
+        pdf_file = PDFFile()
+        for item in items:
+            pdf_file.add_item(item)
+        content = pdf_file.get_content()
+        cache.set(cache_key, content, settings.PDF_CACHE_TIMEOUT)
+    return content
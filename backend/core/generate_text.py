@@ -0,0 +1,25 @@
+import csv
+
+CSV_HEADER = ('Ингредиент', 'Количество', 'Единица измерения')
+TEXT_LINE = '{name} - {amount} {unit}\n'
+
+
+class EchoBuffer:
+    """Псевдо-файл для csv.writer: возвращает строку вместо записи"""
+
+    def write(self, value):
+        return value
+
+
+def generate_csv(items):
+    """Построчно генерирует CSV из элементов [имя, количество, единица]"""
+    writer = csv.writer(EchoBuffer())
+    yield writer.writerow(CSV_HEADER)
+    for item in items:
+        yield writer.writerow(item)
+
+
+def generate_text(items):
+    """Построчно генерирует текстовый список из элементов"""
+    for name, amount, unit in items:
+        yield TEXT_LINE.format(name=name, amount=amount, unit=unit)
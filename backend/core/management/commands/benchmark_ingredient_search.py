@@ -0,0 +1,67 @@
+import random
+import statistics
+import time
+
+from django.core.management.base import BaseCommand, CommandError
+from rest_framework.test import APIRequestFactory
+
+from api.views.recipe_views import IngredientViewSet
+from recipes.models import Ingredient
+
+
+class Command(BaseCommand):
+    help = (
+        'Замер задержки поиска ингредиентов /api/ingredients/?name= '
+        '(p50/p99). Использует ингредиенты, загруженные load_ingredients.'
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--requests',
+            type=int,
+            default=500,
+            help='Количество поисковых запросов',
+        )
+        parser.add_argument(
+            '--length',
+            type=int,
+            default=3,
+            help='Длина строки поиска, как при вводе с клавиатуры',
+        )
+        parser.add_argument(
+            '--seed', type=int, default=0, help='Зерно генератора запросов'
+        )
+
+    def handle(self, *args, **options):
+        names = list(Ingredient.objects.values_list('name', flat=True))
+        if not names:
+            raise CommandError(
+                'Ингредиенты не найдены, сначала выполните load_ingredients.'
+            )
+        if options['requests'] < 2:
+            raise CommandError('Необходимо не меньше двух запросов.')
+        rng = random.Random(options['seed'])
+        view = IngredientViewSet.as_view({'get': 'list'})
+        factory = APIRequestFactory()
+        timings = []
+        for _ in range(options['requests']):
+            name = rng.choice(names)
+            # Примерно половина запросов ищет по началу названия,
+            # остальные - по произвольной его части
+            start = rng.randrange(max(len(name) - options['length'], 0) + 1)
+            if rng.random() < 0.5:
+                start = 0
+            value = name[start:start + options['length']]
+            request = factory.get('/api/ingredients/', {'name': value})
+            started = time.perf_counter()
+            response = view(request)
+            timings.append((time.perf_counter() - started) * 1000)
+            if response.status_code != 200:
+                raise CommandError(
+                    f'Поиск `{value}` вернул код {response.status_code}.'
+                )
+        percentiles = statistics.quantiles(timings, n=100)
+        self.stdout.write(
+            f'Ингредиентов в базе: {len(names)}, запросов: {len(timings)}. '
+            f'p50: {percentiles[49]:.2f} мс, p99: {percentiles[98]:.2f} мс.'
+        )
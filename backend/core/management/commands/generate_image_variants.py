@@ -0,0 +1,39 @@
+import time
+
+from django.core.management.base import BaseCommand
+
+from recipes.images import generate_image_variants
+from recipes.models import Recipe
+
+
+class Command(BaseCommand):
+    help = (
+        'Создание уменьшенных копий картинок рецептов, для которых их еще '
+        'нет, например после загрузки старых рецептов.'
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--force',
+            action='store_true',
+            help='Пересоздать копии для всех рецептов',
+        )
+
+    def handle(self, *args, **options):
+        started = time.perf_counter()
+        recipes = (
+            Recipe.objects.exclude(image='')
+            .only('id', 'image', 'image_variants')
+            .order_by('id')
+        )
+        processed = 0
+        for recipe in recipes.iterator():
+            if options['force'] or (
+                recipe.image_variants.get('source') != recipe.image.name
+            ):
+                generate_image_variants(recipe.id, force=options['force'])
+                processed += 1
+        self.stdout.write(
+            f'Копии картинок созданы для {processed} рецептов за '
+            f'{time.perf_counter() - started:.2f} с.'
+        )
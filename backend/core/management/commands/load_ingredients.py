@@ -1,46 +1,369 @@
+from collections import defaultdict
+import csv
+from io import StringIO
+from itertools import islice
 import json
 from pathlib import Path
+import time
 
 from django.conf import settings
 from django.core.management.base import BaseCommand, CommandError
+from django.db import connection, transaction
 
-from recipes.models import Ingredient, Unit
+from api.search import ingredient_index
+from recipes.models import Ingredient, RecipeIngredient, Unit
+
+JSON_CHUNK_SIZE = 64 * 1024
+JSON_SEPARATORS = ' \t\r\n,'
+INGREDIENT_FIELDS = {'name', 'measurement_unit'}
+
+
+def skip_separators(buffer, position):
+    while position < len(buffer) and buffer[position] in JSON_SEPARATORS:
+        position += 1
+    return position
+
+
+def decode_json_items(decoder, buffer, final):
+    """
+    Разбирает элементы массива из начала буфера. Возвращает разобранные
+    элементы, неразобранный остаток буфера и признак конца массива.
+    """
+    items = []
+    position = skip_separators(buffer, 0)
+    while position < len(buffer):
+        if buffer[position] == ']':
+            return items, '', True
+        try:
+            item, end = decoder.raw_decode(buffer, position)
+        except json.JSONDecodeError:
+            if final:
+                raise
+            # Элемент не поместился в прочитанную часть файла
+            return items, buffer[position:], False
+        if end == len(buffer) and not final:
+            return items, buffer[position:], False
+        items.append(item)
+        position = skip_separators(buffer, end)
+    return items, '', False
+
+
+def iter_json_array(data_file, chunk_size=JSON_CHUNK_SIZE):
+    """
+    Потоково разбирает JSON-массив, читая файл частями: в памяти находится
+    только текущая часть файла и разбираемый элемент.
+    """
+    decoder = json.JSONDecoder()
+    buffer = ''
+    array_started = False
+    while True:
+        chunk = data_file.read(chunk_size)
+        buffer = (buffer + chunk).lstrip(JSON_SEPARATORS)
+        if not array_started and buffer:
+            if buffer[0] != '[':
+                raise json.JSONDecodeError('Ожидался JSON-массив', buffer, 0)
+            buffer = buffer[1:]
+            array_started = True
+        items, buffer, finished = decode_json_items(
+            decoder, buffer, final=not chunk
+        )
+        yield from items
+        if finished:
+            return
+        if not chunk:
+            raise json.JSONDecodeError('Неожиданный конец файла', buffer, 0)
+
+
+def read_json(data_file):
+    """Ингредиенты из JSON-массива объектов {name, measurement_unit}"""
+    for item in iter_json_array(data_file):
+        if isinstance(item, dict) and item.keys() == INGREDIENT_FIELDS:
+            yield item['name'], item['measurement_unit']
+
+
+def read_csv(data_file):
+    """Ингредиенты из CSV со строками вида `название,единица`"""
+    for row in csv.reader(data_file):
+        if len(row) == 2:
+            yield row[0], row[1]
 
 
 class Command(BaseCommand):
-    help = 'Импорт ингредиентов из JSON.'
+    help = 'Импорт ингредиентов из JSON или CSV.'
+
+    READERS = {'json': read_json, 'csv': read_csv}
+    BATCH_SIZE = 5000
 
     @staticmethod
     def make_path():
         return settings.BASE_DIR / '..' / 'data' / 'ingredients.json'
 
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--path', help='Путь к файлу, по умолчанию data/ingredients.json'
+        )
+        parser.add_argument(
+            '--format',
+            choices=self.READERS.keys(),
+            help='Формат файла, по умолчанию определяется по расширению',
+        )
+        parser.add_argument(
+            '--batch-size',
+            type=int,
+            default=self.BATCH_SIZE,
+            help='Количество ингредиентов, добавляемых одним запросом',
+        )
+        parser.add_argument(
+            '--no-copy',
+            action='store_true',
+            help='Не использовать COPY на PostgreSQL',
+        )
+        parser.add_argument(
+            '--sync',
+            '--upsert',
+            action='store_true',
+            dest='sync',
+            help=(
+                'Синхронизировать каталог с файлом: добавить новые '
+                'ингредиенты и обновить единицы измерения у изменившихся'
+            ),
+        )
+        parser.add_argument(
+            '--delete',
+            action='store_true',
+            help=(
+                'При синхронизации удалить отсутствующие в файле ингредиенты, '
+                'которые не используются в рецептах'
+            ),
+        )
+        parser.add_argument(
+            '--dry-run',
+            action='store_true',
+            help='При синхронизации только показать изменения',
+        )
+
     def handle(self, *args, **options):
-        path_to_file = self.make_path()
+        for option in ('delete', 'dry_run'):
+            if options.get(option) and not options.get('sync'):
+                raise CommandError(
+                    f'--{option.replace("_", "-")} используется только '
+                    f'вместе с --sync.'
+                )
+        path_to_file = Path(options.get('path') or self.make_path())
         if not Path.is_file(path_to_file):
             raise CommandError(f'Файл {path_to_file} не найден.')
-        with open(path_to_file, encoding='utf-8') as data_file:
+        file_format = options.get('format') or path_to_file.suffix[1:].lower()
+        if file_format not in self.READERS:
+            raise CommandError(f'Неизвестный формат файла {path_to_file}.')
+        batch_size = options.get('batch_size') or self.BATCH_SIZE
+        use_copy = connection.vendor == 'postgresql' and not options.get(
+            'no_copy'
+        )
+        current_objects_count = Ingredient.objects.count()
+        started = time.perf_counter()
+        with open(path_to_file, encoding='utf-8', newline='') as data_file:
+            rows = self.READERS[file_format](data_file)
+            if options.get('sync'):
+                self.sync(
+                    rows,
+                    batch_size,
+                    delete=options.get('delete'),
+                    dry_run=options.get('dry_run'),
+                )
+                return
             try:
-                data = json.loads(data_file.read())
+                found_objects = self.load(rows, batch_size, use_copy)
             except json.JSONDecodeError as e:
                 raise ValueError(f'Ошибка в json-данных файла {e}')
-            objects = []
-            current_objects_count = Ingredient.objects.count()
-            for item in data:
-                if len(item) != 2:
-                    continue
-                item['measurement_unit'], _ = Unit.objects.get_or_create(
-                    name=item['measurement_unit']
-                )
-                objects.append(Ingredient(**item))
-            found_objects = len(objects)
-            try:
-                Ingredient.objects.bulk_create(objects, ignore_conflicts=True)
-                new_amount = Ingredient.objects.count() - current_objects_count
             except Exception as e:
-                print(f'Ошибка во время заполнения базы данных значениями {e}')
-            else:
-                print(
-                    f'Команда выполнена успешно. '
-                    f'Найдено {found_objects} ингредиентов. Из них новых '
-                    f'{new_amount} добавлено в базу данных.'
+                self.stdout.write(
+                    f'Ошибка во время заполнения базы данных значениями {e}'
+                )
+                return
+        elapsed = max(time.perf_counter() - started, 1e-6)
+        # bulk_create и COPY не отправляют сигналы post_save
+        ingredient_index.invalidate()
+        new_amount = Ingredient.objects.count() - current_objects_count
+        self.stdout.write(
+            f'Команда выполнена успешно. '
+            f'Найдено {found_objects} ингредиентов. Из них новых '
+            f'{new_amount} добавлено в базу данных.'
+        )
+        self.stdout.write(
+            f'Обработано за {elapsed:.2f} с, '
+            f'{found_objects / elapsed:.0f} строк/с.'
+        )
+
+    def load(self, rows, batch_size, use_copy):
+        """Добавляет ингредиенты пачками, возвращает количество строк"""
+        insert_batch = self.copy_batch if use_copy else self.insert_batch
+        units = dict(Unit.objects.values_list('name', 'id'))
+        found_objects = 0
+        rows = iter(rows)
+        while True:
+            batch = list(islice(rows, batch_size))
+            if not batch:
+                return found_objects
+            self.resolve_units({unit for _, unit in batch}, units)
+            insert_batch([(name, units[unit]) for name, unit in batch])
+            found_objects += len(batch)
+
+    def sync(self, rows, batch_size, delete=False, dry_run=False):
+        """
+        Сравнивает файл с каталогом по паре (название, единица измерения)
+        операциями над множествами в памяти и выполняет только нужные
+        добавления, обновления и удаления.
+        """
+        try:
+            source = set(rows)
+        except json.JSONDecodeError as e:
+            raise ValueError(f'Ошибка в json-данных файла {e}')
+        existing = {
+            (name, unit): pk
+            for name, unit, pk in Ingredient.objects.values_list(
+                'name', 'measurement_unit__name', 'id'
+            )
+        }
+        new_keys = source - existing.keys()
+        missing_keys = existing.keys() - source
+        unit_changes = self.find_unit_changes(new_keys, missing_keys)
+        new_keys -= {(name, unit) for name, unit in unit_changes.values()}
+        missing_ids = [
+            existing[key] for key in missing_keys - unit_changes.keys()
+        ]
+        deleted = kept = 0
+        with transaction.atomic():
+            if delete:
+                deleted, kept = self.delete_unused(
+                    missing_ids, batch_size, dry_run
                 )
+            if not dry_run:
+                self.apply_changes(
+                    new_keys,
+                    {
+                        existing[key]: change
+                        for key, change in unit_changes.items()
+                    },
+                    batch_size,
+                )
+        if not dry_run:
+            ingredient_index.invalidate()
+        self.stdout.write(
+            f'{"Пробный запуск, изменения не сохранены. " if dry_run else ""}'
+            f'Найдено {len(source)} ингредиентов. Новых {len(new_keys)}, '
+            f'изменена единица измерения у {len(unit_changes)}, '
+            f'отсутствуют в файле {len(missing_ids)}, удалено {deleted}, '
+            f'используются в рецептах и не удалены {kept}.'
+        )
+
+    @staticmethod
+    def find_unit_changes(new_keys, missing_keys):
+        """
+        Ингредиенты, у которых изменилась только единица измерения:
+        название однозначно встречается и среди новых, и среди
+        отсутствующих в файле. Возвращает {старый ключ: новый ключ}.
+        """
+        new_by_name = defaultdict(list)
+        missing_by_name = defaultdict(list)
+        for name, unit in new_keys:
+            new_by_name[name].append(unit)
+        for name, unit in missing_keys:
+            missing_by_name[name].append(unit)
+        return {
+            (name, missing_by_name[name][0]): (name, units[0])
+            for name, units in new_by_name.items()
+            if len(units) == 1 and len(missing_by_name.get(name, ())) == 1
+        }
+
+    def apply_changes(self, new_keys, unit_changes, batch_size):
+        """Добавляет новые ингредиенты и обновляет единицы измерения"""
+        units = dict(Unit.objects.values_list('name', 'id'))
+        self.resolve_units(
+            {unit for _, unit in new_keys}
+            | {unit for _, unit in unit_changes.values()},
+            units,
+        )
+        new_keys = sorted(new_keys)
+        for start in range(0, len(new_keys), batch_size):
+            self.insert_batch(
+                [
+                    (name, units[unit])
+                    for name, unit in new_keys[start:start + batch_size]
+                ]
+            )
+        Ingredient.objects.bulk_update(
+            [
+                Ingredient(id=pk, measurement_unit_id=units[unit])
+                for pk, (_, unit) in unit_changes.items()
+            ],
+            ['measurement_unit'],
+            batch_size=batch_size,
+        )
+
+    @staticmethod
+    def delete_unused(ids, batch_size, dry_run=False):
+        """
+        Удаляет ингредиенты, не используемые в рецептах. Возвращает
+        количество удаленных и оставленных ингредиентов.
+        """
+        used = set()
+        for start in range(0, len(ids), batch_size):
+            used.update(
+                RecipeIngredient.objects.filter(
+                    ingredient_id__in=ids[start:start + batch_size]
+                ).values_list('ingredient_id', flat=True)
+            )
+        unused = [pk for pk in ids if pk not in used]
+        if not dry_run:
+            for start in range(0, len(unused), batch_size):
+                Ingredient.objects.filter(
+                    id__in=unused[start:start + batch_size]
+                ).delete()
+        return len(unused), len(used)
+
+    @staticmethod
+    def resolve_units(names, units):
+        """Создает недостающие единицы измерения и добавляет их id в units"""
+        missing = names - units.keys()
+        if not missing:
+            return
+        Unit.objects.bulk_create(
+            [Unit(name=name) for name in missing], ignore_conflicts=True
+        )
+        units.update(
+            Unit.objects.filter(name__in=missing).values_list('name', 'id')
+        )
+
+    @staticmethod
+    def insert_batch(batch):
+        Ingredient.objects.bulk_create(
+            [
+                Ingredient(name=name, measurement_unit_id=unit_id)
+                for name, unit_id in batch
+            ],
+            ignore_conflicts=True,
+        )
+
+    @staticmethod
+    def copy_batch(batch):
+        """
+        Загрузка через COPY во временную таблицу и перенос новых строк,
+        так как сам COPY не умеет пропускать дубликаты.
+        """
+        data = StringIO()
+        csv.writer(data).writerows(batch)
+        data.seek(0)
+        table = Ingredient._meta.db_table
+        with transaction.atomic(), connection.cursor() as cursor:
+            cursor.execute(
+                'CREATE TEMP TABLE ingredient_import '
+                '(name text, measurement_unit_id bigint) ON COMMIT DROP'
+            )
+            cursor.copy_expert(
+                'COPY ingredient_import FROM STDIN WITH (FORMAT csv)', data
+            )
+            cursor.execute(
+                f'INSERT INTO {table} (name, measurement_unit_id) '
+                'SELECT DISTINCT name, measurement_unit_id '
+                'FROM ingredient_import ON CONFLICT DO NOTHING'
+            )
@@ -0,0 +1,19 @@
+import time
+
+from django.core.management.base import BaseCommand
+
+from recipes.services import recount_counters
+
+
+class Command(BaseCommand):
+    help = (
+        'Пересчет счетчиков избранного, списков покупок, рецептов '
+        'и подписчиков. Исправляет расхождения после массовых операций.'
+    )
+
+    def handle(self, *args, **options):
+        started = time.perf_counter()
+        recount_counters()
+        self.stdout.write(
+            f'Счетчики пересчитаны за {time.perf_counter() - started:.2f} с.'
+        )
@@ -0,0 +1,21 @@
+import time
+
+from django.core.management.base import BaseCommand
+
+from recipes.services import update_trending_scores
+
+
+class Command(BaseCommand):
+    help = (
+        'Пересчет оценки trending для сортировки рецептов '
+        '?ordering=trending. Запускается периодически, например из cron.'
+    )
+
+    def handle(self, *args, **options):
+        started = time.perf_counter()
+        scored = update_trending_scores()
+        self.stdout.write(
+            f'Оценка trending пересчитана за '
+            f'{time.perf_counter() - started:.2f} с, '
+            f'рецептов с ненулевой оценкой: {scored}.'
+        )
@@ -0,0 +1,27 @@
+class ExternalFieldsMixin:
+    """
+    Не записывает при save() поля из external_fields у существующих
+    объектов. Такие поля меняются только запросами UPDATE (счетчики,
+    фоновые задачи), а экземпляр, загруженный до этого, вернул бы в них
+    устаревшие значения.
+    """
+
+    external_fields = ()
+
+    def save(self, *args, **kwargs):
+        if not self._state.adding and not kwargs.get('force_insert'):
+            update_fields = kwargs.get('update_fields')
+            if update_fields is None:
+                deferred = self.get_deferred_fields()
+                update_fields = [
+                    field.name
+                    for field in self._meta.concrete_fields
+                    if not field.primary_key
+                    and field.attname not in deferred
+                ]
+            kwargs['update_fields'] = [
+                name
+                for name in update_fields
+                if name not in self.external_fields
+            ]
+        return super().save(*args, **kwargs)
@@ -76,6 +76,16 @@ DATABASES = {
     }
 }
 
+CACHES = {
+    'default': {
+        'BACKEND': os.getenv(
+            'CACHE_BACKEND',
+            default='django.core.cache.backends.locmem.LocMemCache',
+        ),
+        'LOCATION': os.getenv('CACHE_LOCATION', default='foodgram'),
+    }
+}
+
 AUTH_PASSWORD_VALIDATORS = [
     {
         'NAME': 'django.contrib.auth.password_validation.UserAttributeSimilarityValidator'
@@ -130,6 +140,48 @@ INGREDIENT_MIN_VALUE = 1
 UNIT_NAME_MAX_LENGTH = 200
 TAG_MAX_LENGTH = 200
 MAX_TAG_SLUG_LENGTH = 200
+BULK_RECIPES_MAX_LENGTH = 100
+# Ограничения картинки рецепта: размер файла в байтах и число пикселей
+RECIPE_IMAGE_MAX_SIZE = int(
+    os.getenv('RECIPE_IMAGE_MAX_SIZE', default=10 * 1024 * 1024)
+)
+RECIPE_IMAGE_MAX_PIXELS = int(
+    os.getenv('RECIPE_IMAGE_MAX_PIXELS', default=40_000_000)
+)
+# Срок действия идентификатора заранее загруженной картинки, сек.
+RECIPE_IMAGE_UPLOAD_MAX_AGE = 24 * 60 * 60
+# Ширины уменьшенных копий картинки рецепта (WebP и JPEG), пикс.
+IMAGE_VARIANT_WIDTHS = (320, 640, 1280)
+# Создавать копии в фоновом пуле потоков, а не в запросе
+IMAGE_VARIANTS_ASYNC = os.getenv('IMAGE_VARIANTS_ASYNC', 'True') == 'True'
+IMAGE_VARIANTS_WORKERS = int(os.getenv('IMAGE_VARIANTS_WORKERS', default=2))
+# Время жизни кэша PDF со списком покупок, сек.
+PDF_CACHE_TIMEOUT = int(os.getenv('PDF_CACHE_TIMEOUT', default=60 * 60))
+PDF_CACHE_PREFIX = 'shopping_cart_pdf'
+# Время жизни индекса поиска ингредиентов в памяти процесса, сек.
+INGREDIENT_INDEX_TIMEOUT = int(
+    os.getenv('INGREDIENT_INDEX_TIMEOUT', default=300)
+)
+# Окно и период полураспада оценки trending, см. update_trending
+TRENDING_WINDOW_DAYS = int(os.getenv('TRENDING_WINDOW_DAYS', default=7))
+TRENDING_HALF_LIFE_HOURS = float(
+    os.getenv('TRENDING_HALF_LIFE_HOURS', default=24)
+)
+TRENDING_BATCH_SIZE = 1000
+# Кэш словаря {slug: id} тегов для фильтра рецептов, сек.
+TAG_MAP_TIMEOUT = int(os.getenv('TAG_MAP_TIMEOUT', default=60 * 60))
+TAG_MAP_CACHE_KEY = 'recipe_tag_map'
+# Подсчет общего числа объектов при постраничной пагинации рецептов:
+# exact - COUNT(*) на каждый запрос, approximate - кэш на
+# PAGINATION_COUNT_TIMEOUT сек. для каждого набора фильтров и оценка
+# pg_class.reltuples для списка без фильтров на PostgreSQL
+PAGINATION_COUNT_MODE = os.getenv('PAGINATION_COUNT_MODE', default='exact')
+PAGINATION_COUNT_TIMEOUT = int(
+    os.getenv('PAGINATION_COUNT_TIMEOUT', default=30)
+)
+PAGINATION_COUNT_PREFIX = 'pagination_count'
+# Оценке reltuples доверяем только для больших таблиц
+PAGINATION_ESTIMATE_THRESHOLD = 10000
 
 if DEBUG:
     CORS_ORIGIN_ALLOW_ALL = True
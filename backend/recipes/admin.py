@@ -1,5 +1,4 @@
 from django.contrib import admin
-from django.utils.translation import gettext_lazy as _
 
 from recipes.models import (
     Favorite,
@@ -50,15 +49,12 @@ class RecipeAdmin(admin.ModelAdmin):
         'author',
         'date_added',
         'favorites_count',
+        'in_carts_count',
     )
-    readonly_fields = ('date_added', 'favorites_count')
+    readonly_fields = ('date_added', 'favorites_count', 'in_carts_count')
     list_filter = ('name', 'author', 'tags')
     inlines = (RecipeIngredientInLine,)
 
-    @admin.display(description=_('Добавлений в избранное'))
-    def favorites_count(self, obj):
-        return obj.favorites.count()
-
 
 @admin.register(Favorite)
 class FavoritesAdmin(admin.ModelAdmin):
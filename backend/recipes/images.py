@@ -0,0 +1,127 @@
+from concurrent.futures import ThreadPoolExecutor
+from io import BytesIO
+import logging
+from pathlib import PurePosixPath
+import threading
+
+from django.conf import settings
+from django.core.files.base import ContentFile
+from django.core.files.storage import default_storage
+from django.db import close_old_connections
+
+from PIL import Image, ImageOps
+
+logger = logging.getLogger(__name__)
+
+# Параметры сохранения и формат изображения Pillow для каждого варианта
+VARIANT_FORMATS = {
+    'webp': ('WEBP', {'quality': 80, 'method': 4}),
+    'jpeg': ('JPEG', {'quality': 82, 'optimize': True, 'progressive': True}),
+}
+
+executor = ThreadPoolExecutor(
+    max_workers=settings.IMAGE_VARIANTS_WORKERS,
+    thread_name_prefix='image_variants',
+)
+# Картинки (id рецепта, имя файла), варианты которых уже создаются
+pending = set()
+pending_lock = threading.Lock()
+
+
+def variant_name(name, width, extension):
+    """recipes/images/photo.png -> recipes/images/photo_320.webp"""
+    path = PurePosixPath(name)
+    return str(path.with_name(f'{path.stem}_{width}.{extension}'))
+
+
+def render_variants(image_file, name):
+    """
+    Сохраняет уменьшенные копии картинки рядом с оригиналом. Ширины
+    больше исходной пропускаются. Возвращает {формат: [[ширина, имя]]}.
+    """
+    variants = {extension: [] for extension in VARIANT_FORMATS}
+    with Image.open(image_file) as source:
+        original = ImageOps.exif_transpose(source).convert('RGB')
+        for width in sorted(settings.IMAGE_VARIANT_WIDTHS):
+            if width > original.width:
+                break
+            height = max(round(original.height * width / original.width), 1)
+            resized = original.resize((width, height), Image.LANCZOS)
+            for extension, (image_format, options) in VARIANT_FORMATS.items():
+                buffer = BytesIO()
+                resized.save(buffer, image_format, **options)
+                saved_name = default_storage.save(
+                    variant_name(name, width, extension),
+                    ContentFile(buffer.getvalue()),
+                )
+                variants[extension].append([width, saved_name])
+    return variants
+
+
+def delete_variants(variants):
+    for extension in VARIANT_FORMATS:
+        for _width, name in variants.get(extension, ()):
+            default_storage.delete(name)
+
+
+def generate_image_variants(recipe_id, force=False):
+    """
+    Создает варианты картинки рецепта и сохраняет их список в
+    Recipe.image_variants. Варианты предыдущей картинки удаляются.
+    Без force уже созданные варианты текущей картинки не пересоздаются.
+    """
+    from recipes.models import Recipe
+
+    recipe = Recipe.objects.filter(pk=recipe_id).first()
+    if recipe is None or not recipe.image:
+        return
+    source = recipe.image.name
+    if not force and recipe.image_variants.get('source') == source:
+        return
+    old_variants = recipe.image_variants
+    with recipe.image.open('rb') as image_file:
+        variants = render_variants(image_file, source)
+    variants['source'] = source
+    # Картинку могли заменить, пока создавались варианты
+    updated = Recipe.objects.filter(pk=recipe_id, image=source).update(
+        image_variants=variants
+    )
+    delete_variants(variants if not updated else old_variants)
+
+
+def run_in_background(recipe_id, key):
+    try:
+        generate_image_variants(recipe_id)
+    except Exception:
+        logger.exception(
+            'Не удалось создать варианты картинки рецепта %s', recipe_id
+        )
+    finally:
+        pending.discard(key)
+        close_old_connections()
+
+
+def schedule_image_variants(recipe_id, source):
+    """
+    Ставит создание вариантов картинки source в фоновый пул потоков,
+    если они еще не созданы и не создаются
+    """
+    from recipes.models import Recipe
+
+    key = (recipe_id, source)
+    with pending_lock:
+        if key in pending:
+            return
+        pending.add(key)
+    if Recipe.objects.filter(
+        pk=recipe_id, image_variants__source=source
+    ).exists():
+        pending.discard(key)
+        return
+    if settings.IMAGE_VARIANTS_ASYNC:
+        executor.submit(run_in_background, recipe_id, key)
+        return
+    try:
+        generate_image_variants(recipe_id)
+    finally:
+        pending.discard(key)
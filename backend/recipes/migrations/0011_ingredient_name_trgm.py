@@ -0,0 +1,33 @@
+from django.contrib.postgres.operations import TrigramExtension
+from django.db import migrations
+
+# Django строит icontains/istartswith на PostgreSQL как
+# UPPER("name"::text) LIKE UPPER(...), поэтому индекс по тому же выражению
+INDEX_NAME = 'recipes_ingredient_name_trgm'
+CREATE_INDEX_SQL = (
+    f'CREATE INDEX IF NOT EXISTS {INDEX_NAME} ON recipes_ingredient '
+    'USING gin (UPPER("name"::text) gin_trgm_ops)'
+)
+DROP_INDEX_SQL = f'DROP INDEX IF EXISTS {INDEX_NAME}'
+
+
+def create_trigram_index(apps, schema_editor):
+    if schema_editor.connection.vendor == 'postgresql':
+        schema_editor.execute(CREATE_INDEX_SQL)
+
+
+def drop_trigram_index(apps, schema_editor):
+    if schema_editor.connection.vendor == 'postgresql':
+        schema_editor.execute(DROP_INDEX_SQL)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('recipes', '0010_auto_20221211_0118'),
+    ]
+
+    operations = [
+        TrigramExtension(),
+        migrations.RunPython(create_trigram_index, drop_trigram_index),
+    ]
@@ -5,6 +5,8 @@ from django.core.validators import MinValueValidator
 from django.db import models
 from django.utils.translation import gettext_lazy as _
 
+from core.models import ExternalFieldsMixin
+
 User = get_user_model()
 
 
@@ -95,10 +97,72 @@ class Ingredient(models.Model):
         )
 
 
-class Recipe(models.Model):
+class RecipeQuerySet(models.QuerySet):
+    """Выборки рецептов для API."""
+
+    def with_related(self):
+        """
+        Подгружает автора, теги и ингредиенты с единицами измерения
+        фиксированным числом запросов, независимо от размера выборки.
+        """
+        return self.select_related('author').prefetch_related(
+            'tags',
+            models.Prefetch(
+                'recipe_ingredients',
+                queryset=RecipeIngredient.objects.select_related(
+                    'ingredient__measurement_unit'
+                ),
+            ),
+        )
+
+    def latest_per_author(self, limit):
+        """
+        Оставляет не больше limit последних рецептов каждого автора.
+        Ограничение выполняется в БД коррелированным подзапросом с LIMIT.
+        """
+        latest = (
+            self.model.objects.filter(author=models.OuterRef('author'))
+            .order_by('-date_added', '-id')
+            .values('pk')[:limit]
+        )
+        return self.filter(pk__in=models.Subquery(latest))
+
+    def with_user_flags(self, user):
+        """
+        Аннотирует рецепты флагами is_favorited и is_in_shopping_cart
+        одним запросом через подзапросы EXISTS.
+        """
+        if not user.is_authenticated:
+            return self.annotate(
+                is_favorited=models.Value(False, models.BooleanField()),
+                is_in_shopping_cart=models.Value(
+                    False, models.BooleanField()
+                ),
+            )
+        return self.annotate(
+            is_favorited=models.Exists(
+                Favorite.objects.filter(
+                    user=user, recipe=models.OuterRef('pk')
+                )
+            ),
+            is_in_shopping_cart=models.Exists(
+                ShoppingCart.objects.filter(
+                    user=user, recipe=models.OuterRef('pk')
+                )
+            ),
+        )
+
+
+class Recipe(ExternalFieldsMixin, models.Model):
     """Модель рецепта."""
 
     MODEL_STRING = '{name:.50}'
+    external_fields = (
+        'favorites_count',
+        'in_carts_count',
+        'trending_score',
+        'image_variants',
+    )
 
     name = models.CharField(
         max_length=settings.RECIPE_NAME_MAX_LENGTH,
@@ -110,14 +174,23 @@ class Recipe(models.Model):
     image = models.ImageField(
         verbose_name=_('Изображение'), upload_to='recipes/images/'
     )
+    # Уменьшенные копии картинки создаются в фоне, см. recipes.images
+    image_variants = models.JSONField(
+        verbose_name=_('Варианты изображения'),
+        default=dict,
+        blank=True,
+        editable=False,
+    )
     cooking_time = models.PositiveSmallIntegerField(
         default=1,
         verbose_name=_('Время приготовления, мин.'),
         validators=[MinValueValidator(settings.RECIPE_MIN_COOKING_TIME)],
         null=False,
     )
+    # Вместо одиночных индексов - составные recipe_date_idx
+    # и recipe_author_date_idx
     date_added = models.DateTimeField(
-        verbose_name=_('Дата добавления'), auto_now_add=True, db_index=True
+        verbose_name=_('Дата добавления'), auto_now_add=True
     )
     author = models.ForeignKey(
         User,
@@ -125,6 +198,24 @@ class Recipe(models.Model):
         related_name='recipes',
         verbose_name=_('Автор'),
         null=False,
+        db_index=False,
+    )
+    # Счетчики поддерживаются сигналами recipes.signals,
+    # пересчитываются командой recount_counters
+    favorites_count = models.PositiveIntegerField(
+        verbose_name=_('Добавлений в избранное'), default=0, editable=False
+    )
+    in_carts_count = models.PositiveIntegerField(
+        verbose_name=_('Добавлений в список покупок'),
+        default=0,
+        editable=False,
+    )
+    # Затухающая со временем популярность, вычисляется периодически
+    # командой update_trending
+    trending_score = models.FloatField(
+        verbose_name=_('Популярность за последнее время'),
+        default=0,
+        editable=False,
     )
     # M2M Models
     tags = models.ManyToManyField(
@@ -137,10 +228,35 @@ class Recipe(models.Model):
         verbose_name=_('Ингредиенты'),
     )
 
+    objects = RecipeQuerySet.as_manager()
+
     class Meta:
         verbose_name = _('Рецепт')
         verbose_name_plural = _('Рецепты')
         ordering = ('-date_added',)
+        # Индексы под сортировку списка по умолчанию, по курсору,
+        # рецепты автора и сортировки ?ordering=
+        indexes = [
+            models.Index(
+                fields=['-date_added', '-id'], name='recipe_date_idx'
+            ),
+            models.Index(
+                fields=['author', '-date_added', '-id'],
+                name='recipe_author_date_idx',
+            ),
+            models.Index(
+                fields=['-favorites_count', '-date_added', '-id'],
+                name='recipe_popular_idx',
+            ),
+            models.Index(
+                fields=['-trending_score', '-date_added', '-id'],
+                name='recipe_trending_idx',
+            ),
+            models.Index(
+                fields=['cooking_time', '-date_added', '-id'],
+                name='recipe_cooking_time_idx',
+            ),
+        ]
 
     def __str__(self):
         return self.MODEL_STRING.format(name=self.name)
@@ -156,7 +272,8 @@ class RecipeIngredient(models.Model):
         related_name='recipe_ingredients',
         verbose_name=_('Рецепт'),
         on_delete=models.CASCADE,
-        db_index=True,
+        # Покрывается уникальным индексом (recipe, ingredient)
+        db_index=False,
     )
     ingredient = models.ForeignKey(
         Ingredient,
@@ -205,7 +322,8 @@ class Favorite(models.Model):
         on_delete=models.CASCADE,
         verbose_name=_('Пользователь'),
         related_name='favorite_recipes',
-        db_index=True,
+        # Покрывается уникальным индексом (user, recipe)
+        db_index=False,
     )
     date_added = models.DateTimeField(
         verbose_name=_('Дата добавления'), auto_now_add=True, db_index=True
@@ -217,6 +335,11 @@ class Favorite(models.Model):
                 fields=['user', 'recipe'], name='Unique recipe with user'
             )
         ]
+        indexes = [
+            models.Index(
+                fields=['user', '-date_added'], name='favorite_user_date_idx'
+            )
+        ]
         verbose_name = _('Избранный рецепт')
         verbose_name_plural = _('Избранные рецепты')
         ordering = ('-date_added',)
@@ -234,7 +357,8 @@ class ShoppingCart(models.Model):
         User,
         related_name='shoppingcart',
         on_delete=models.CASCADE,
-        db_index=True,
+        # Покрывается уникальным индексом (user, recipe)
+        db_index=False,
     )
     recipe = models.ForeignKey(
         Recipe,
@@ -0,0 +1,94 @@
+from collections import defaultdict
+from datetime import timedelta
+
+from django.conf import settings
+from django.contrib.auth import get_user_model
+from django.db import transaction
+from django.db.models import Count, F, OuterRef, Subquery, Sum
+from django.db.models.functions import Coalesce, Lower
+from django.utils import timezone
+
+from recipes.models import Favorite, Recipe, RecipeIngredient, ShoppingCart
+from users.models import Subscription
+
+User = get_user_model()
+
+
+def get_shopping_cart_ingredients(user):
+    """
+    Суммарное количество каждого ингредиента по рецептам из списка покупок
+    пользователя. Один запрос от RecipeIngredient с группировкой по
+    ингредиенту: каждая строка рецепта учитывается ровно один раз.
+    Возвращает словари с ключами ingredient (id), name, measurement_unit
+    и amount, отсортированные по имени ингредиента.
+    """
+    return (
+        RecipeIngredient.objects.filter(recipe__shoppingcart__user=user)
+        .values(
+            'ingredient',
+            name=F('ingredient__name'),
+            measurement_unit=F('ingredient__measurement_unit__name'),
+        )
+        .annotate(amount=Sum('amount'))
+        .order_by(Lower('ingredient__name'), 'ingredient')
+    )
+
+
+def count_related(model, field):
+    """Подзапрос количества строк model, ссылающихся на объект через field"""
+    return Coalesce(
+        Subquery(
+            model.objects.filter(**{field: OuterRef('pk')})
+            .order_by()
+            .values(field)
+            .annotate(count=Count('pk'))
+            .values('count')
+        ),
+        0,
+    )
+
+
+def recount_counters():
+    """Пересчитывает все счетчики рецептов и пользователей двумя UPDATE"""
+    with transaction.atomic():
+        Recipe.objects.update(
+            favorites_count=count_related(Favorite, 'recipe'),
+            in_carts_count=count_related(ShoppingCart, 'recipe'),
+        )
+        User.objects.update(
+            recipes_count=count_related(Recipe, 'author'),
+            subscribers_count=count_related(Subscription, 'subscription'),
+        )
+
+
+def update_trending_scores(now=None):
+    """
+    Пересчитывает Recipe.trending_score по добавлениям в избранное и в
+    список покупок за последние TRENDING_WINDOW_DAYS дней. Вклад каждого
+    добавления убывает вдвое за TRENDING_HALF_LIFE_HOURS часов.
+    Возвращает количество рецептов с ненулевой оценкой.
+    """
+    now = now or timezone.now()
+    since = now - timedelta(days=settings.TRENDING_WINDOW_DAYS)
+    half_life = settings.TRENDING_HALF_LIFE_HOURS * 60 * 60
+    scores = defaultdict(float)
+    for model in (Favorite, ShoppingCart):
+        events = (
+            model.objects.filter(date_added__gte=since)
+            .order_by()
+            .values_list('recipe_id', 'date_added')
+        )
+        for recipe_id, date_added in events.iterator():
+            age = max((now - date_added).total_seconds(), 0)
+            scores[recipe_id] += 0.5 ** (age / half_life)
+    with transaction.atomic():
+        Recipe.objects.filter(trending_score__gt=0).update(trending_score=0)
+        Recipe.objects.bulk_update(
+            [
+                Recipe(pk=recipe_id, trending_score=score)
+                for recipe_id, score in scores.items()
+            ],
+            ['trending_score'],
+            batch_size=settings.TRENDING_BATCH_SIZE,
+        )
+    return len(scores)
@@ -0,0 +1,75 @@
+from django.contrib.auth import get_user_model
+from django.db import transaction
+from django.db.models import F
+from django.db.models.signals import post_delete, post_save
+from django.dispatch import receiver
+
+from recipes.images import schedule_image_variants
+from recipes.models import Favorite, Recipe, ShoppingCart
+from recipes.services import count_related
+from users.models import Subscription
+
+User = get_user_model()
+
+# Счетчик, который меняется при добавлении или удалении объекта:
+# модель объекта -> (модель счетчика, поле со ссылкой, поле счетчика)
+COUNTERS = {
+    Favorite: (Recipe, 'recipe_id', 'favorites_count'),
+    ShoppingCart: (Recipe, 'recipe_id', 'in_carts_count'),
+    Recipe: (User, 'author_id', 'recipes_count'),
+    Subscription: (User, 'subscription_id', 'subscribers_count'),
+}
+
+
+def change_counters(sender, ids, delta):
+    """
+    Атомарно меняет счетчики объектов ids выражением F(), не уходя ниже
+    нуля. Используется и для массовых операций, которые не отправляют
+    сигналы.
+    """
+    model, _reference, field = COUNTERS[sender]
+    queryset = model.objects.filter(pk__in=ids)
+    if delta < 0:
+        queryset = queryset.filter(**{f'{field}__gte': -delta})
+    queryset.update(**{field: F(field) + delta})
+
+
+def recount_related(sender, ids):
+    """
+    Пересчитывает счетчики объектов ids по фактическому числу строк sender.
+    Нужен, когда неизвестно, сколько строк действительно добавлено,
+    например после bulk_create(ignore_conflicts=True).
+    """
+    model, reference, field = COUNTERS[sender]
+    model.objects.filter(pk__in=ids).update(
+        **{field: count_related(sender, reference)}
+    )
+
+
+@receiver(post_save, sender=Favorite)
+@receiver(post_save, sender=ShoppingCart)
+@receiver(post_save, sender=Recipe)
+@receiver(post_save, sender=Subscription)
+def increase_counter(sender, instance, created, **kwargs):
+    if created:
+        change_counters(sender, [getattr(instance, COUNTERS[sender][1])], 1)
+
+
+@receiver(post_delete, sender=Favorite)
+@receiver(post_delete, sender=ShoppingCart)
+@receiver(post_delete, sender=Recipe)
+@receiver(post_delete, sender=Subscription)
+def decrease_counter(sender, instance, **kwargs):
+    change_counters(sender, [getattr(instance, COUNTERS[sender][1])], -1)
+
+
+@receiver(post_save, sender=Recipe)
+def update_image_variants(sender, instance, **kwargs):
+    """Варианты новой картинки создаются после фиксации транзакции"""
+    if instance.image and (
+        instance.image_variants.get('source') != instance.image.name
+    ):
+        source = instance.image.name
+        transaction.on_commit(
+            lambda: schedule_image_variants(instance.pk, source)
+        )
@@ -13,11 +13,14 @@ class APITestBase:
         # Recipes
         'recipe_list': '/api/recipes/',
         'recipe_detail': '/api/recipes/{recipe_id}/',
+        'recipe_image_upload': '/api/recipes/images/',
         # Shopping cart
         'shopping_cart': '/api/recipes/download_shopping_cart/',
         'recipe_in_cart': '/api/recipes/{recipe_id}/shopping_cart/',
+        'shopping_cart_bulk': '/api/recipes/shopping_cart/',
         # Favorites
         'favorites': '/api/recipes/{recipe_id}/favorite/',
+        'favorites_bulk': '/api/recipes/favorite/',
         # Subscriptions
         'subscriptions': '/api/users/subscriptions/',
         'subscribe': '/api/users/{user_id}/subscribe/',
@@ -1,6 +1,7 @@
 from pathlib import Path
 
 from django.utils.version import get_version
+import pytest
 
 BASE_DIR = Path(__file__).resolve().parent.parent
 APP_DIRS = ['api', 'core', 'recipes', 'users']
@@ -15,3 +16,16 @@ for app_dir in APP_DIRS:
         )
 
 pytest_plugins = ['tests.fixtures.fixture_users', 'tests.fixtures.fixture_data']
+
+
+@pytest.fixture(autouse=True)
+def clear_ingredient_index():
+    """Индекс ингредиентов и словарь тегов не должны переживать откат БД"""
+    from api.filters import invalidate_tag_map
+    from api.search import ingredient_index
+
+    ingredient_index.invalidate()
+    invalidate_tag_map()
+    yield
+    ingredient_index.invalidate()
+    invalidate_tag_map()
@@ -1,5 +1,7 @@
 import pytest
 
+from django.contrib.admin.utils import lookup_field
+
 from recipes.admin import RecipeAdmin
 from recipes.models import Favorite
 
@@ -9,12 +11,14 @@ class TestAdminSite:
     """Тест администраторской части проекта"""
 
     def test_favorites_count(self, user, recipe):
-        assert RecipeAdmin.favorites_count(self, recipe) == 0, (
+        assert 'favorites_count' in RecipeAdmin.list_display
+        assert lookup_field('favorites_count', recipe)[2] == 0, (
             'Если рецепт не добавлен в избранное, то количество в столбце '
             '`Добавлений в избранное` должно быть 0'
         )
         Favorite.objects.create(user=user, recipe=recipe)
-        assert RecipeAdmin.favorites_count(self, recipe) == 1, (
+        recipe.refresh_from_db()
+        assert lookup_field('favorites_count', recipe)[2] == 1, (
             'Если рецепт добавлен в избранное 1 раз, то количество в столбце '
             '`Добавлений в избранное` должно быть 1'
         )
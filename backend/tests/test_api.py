@@ -1,9 +1,25 @@
+import base64
+import json
+
 from django.contrib.auth import get_user_model
+from django.core.cache import cache
+from django.core.files.uploadedfile import SimpleUploadedFile
+from django.db import connection
+from django.test.utils import CaptureQueriesContext
 
 import pytest
 
-from api.serializers.recipe_serializers import IngredientSerializer
-from recipes.models import Favorite, ShoppingCart, Recipe
+from api.serializers.recipe_serializers import (
+    IngredientSerializer,
+    RecipeCreateSerializer,
+)
+from recipes.models import (
+    Favorite,
+    Ingredient,
+    Recipe,
+    RecipeIngredient,
+    ShoppingCart,
+)
 
 from .common import APITestBase
 
@@ -171,6 +187,8 @@ class TestAPI(APITestBase):
             'id': recipe_with_ingredients.id,
             'name': recipe_with_ingredients.name,
             'image': None,
+            'image_thumb': None,
+            'image_srcset': {},
             'cooking_time': recipe_with_ingredients.cooking_time,
         }
         assert (
@@ -216,6 +234,89 @@ class TestAPI(APITestBase):
         response = self.assert_status_code(200, user_client.get(url), url=url)
         assert response['Content-type'] == 'application/pdf'
 
+    def test_download_shopping_cart_errors(
+        self, client, admin_client, user_client, shopping_cart
+    ):
+        """Test shopping cart download errors are returned as JSON"""
+        url = self.urls['shopping_cart']
+        for response in (
+            self.assert_status_code(401, client.get(url), url=url),
+            self.assert_status_code(400, admin_client.get(url), url=url),
+            self.assert_status_code(
+                404, user_client.get(url + '?format=xls'), url=url
+            ),
+            self.assert_status_code(
+                406,
+                user_client.get(url, HTTP_ACCEPT='application/json'),
+                url=url,
+            ),
+        ):
+            assert response['Content-type'] == 'application/json'
+        assert 'detail' in client.get(url).json()
+        assert 'errors' in admin_client.get(url).json()
+
+    def test_download_shopping_cart_formats(
+        self, admin_client, user_client, shopping_cart, recipe_with_ingredients
+    ):
+        """Test shopping cart export as csv and plain text"""
+        url = self.urls['shopping_cart']
+        ingredients = recipe_with_ingredients.recipe_ingredients.order_by(
+            'ingredient__name'
+        )
+        response = self.assert_status_code(
+            200, user_client.get(url + '?format=csv'), url=url
+        )
+        assert response['Content-type'] == 'text/csv; charset=utf-8'
+        lines = b''.join(response.streaming_content).decode().splitlines()
+        assert lines[0] == 'Ингредиент,Количество,Единица измерения'
+        assert lines[1:] == [
+            f'{item.ingredient.name.capitalize()},{item.amount},'
+            f'{item.ingredient.measurement_unit.name}'
+            for item in ingredients
+        ]
+
+        response = self.assert_status_code(
+            200, user_client.get(url + '?format=txt'), url=url
+        )
+        assert response['Content-type'] == 'text/plain; charset=utf-8'
+        lines = b''.join(response.streaming_content).decode().splitlines()
+        assert lines == [
+            f'{item.ingredient.name.capitalize()} - {item.amount} '
+            f'{item.ingredient.measurement_unit.name}'
+            for item in ingredients
+        ]
+
+        self.assert_status_code(
+            400, admin_client.get(url + '?format=csv'), url=url
+        )
+        self.assert_status_code(
+            404, user_client.get(url + '?format=xls'), url=url
+        )
+
+    def test_download_shopping_cart_cache(
+        self, mocker, user_client, shopping_cart, recipe_with_ingredients
+    ):
+        """Test unchanged shopping cart PDF is rendered only once"""
+        from django.core.cache import cache
+
+        from core.generate_pdf import PDFFile
+
+        cache.clear()
+        create = mocker.spy(PDFFile, 'create')
+        url = self.urls['shopping_cart']
+        first = self.assert_status_code(200, user_client.get(url), url=url)
+        second = self.assert_status_code(200, user_client.get(url), url=url)
+        assert first.content == second.content
+        assert create.call_count == 1, 'PDF должен браться из кэша'
+
+        recipe_ingredient = recipe_with_ingredients.recipe_ingredients.first()
+        recipe_ingredient.amount += 1
+        recipe_ingredient.save()
+        self.assert_status_code(200, user_client.get(url), url=url)
+        assert create.call_count == 2, (
+            'После изменения списка покупок PDF должен создаваться заново'
+        )
+
     def test_favorite_recipe(self, user_client, favorite):
         """Test add recipe to favorites"""
 
@@ -245,6 +346,8 @@ class TestAPI(APITestBase):
             'id': favorite.recipe.id,
             'name': favorite.recipe.name,
             'image': None,
+            'image_thumb': None,
+            'image_srcset': {},
             'cooking_time': favorite.recipe.cooking_time,
         }
         assert Favorite.objects.count() == 1, 'Рецепт должен быть добавлен'
@@ -357,6 +460,8 @@ class TestAPI(APITestBase):
             'id': recipe_with_ingredients.id,
             'name': recipe_with_ingredients.name,
             'image': None,
+            'image_thumb': None,
+            'image_srcset': {},
             'text': recipe_with_ingredients.text,
             'is_favorited': False,
             'is_in_shopping_cart': False,
@@ -571,3 +676,518 @@ class TestAPI(APITestBase):
             Recipe.objects.get(id=response.data['id']).name
             == recipe_data['name']
         ), 'Неверное имя рецепта в базе данных'
+
+    def test_recipe_list_user_flags_queries(self, user_client, user):
+        """Test is_favorited/is_in_shopping_cart don't cost a query per row"""
+        recipes = [
+            Recipe.objects.create(
+                name=f'recipe {i}', author=user, cooking_time=10
+            )
+            for i in range(10)
+        ]
+        Favorite.objects.create(user=user, recipe=recipes[0])
+        ShoppingCart.objects.create(user=user, recipe=recipes[1])
+
+        def count_flag_queries(limit):
+            url = self.urls['recipe_list'] + f'?limit={limit}'
+            with CaptureQueriesContext(connection) as context:
+                response = self.assert_status_code(
+                    200, user_client.get(url), url=url
+                )
+            assert len(response.data['results']) == limit
+            return response, sum(
+                'recipes_favorite' in query['sql']
+                or 'recipes_shoppingcart' in query['sql']
+                for query in context.captured_queries
+            )
+
+        _, small_page_queries = count_flag_queries(2)
+        response, big_page_queries = count_flag_queries(10)
+        assert small_page_queries == big_page_queries, (
+            'Количество запросов к избранному и списку покупок не должно '
+            'зависеть от размера страницы'
+        )
+        flags = {
+            recipe['id']: (
+                recipe['is_favorited'],
+                recipe['is_in_shopping_cart'],
+            )
+            for recipe in response.data['results']
+        }
+        assert flags[recipes[0].id] == (True, False)
+        assert flags[recipes[1].id] == (False, True)
+        assert flags[recipes[2].id] == (False, False)
+
+    def test_recipe_list_nested_queries(
+        self, client, user, tag, tag2, ingredient, ingredient2, ingredient3
+    ):
+        """Test nested tags/ingredients/author are rendered with prefetch"""
+        for i in range(10):
+            recipe = Recipe.objects.create(
+                name=f'recipe {i}', author=user, cooking_time=10
+            )
+            recipe.tags.add(tag, tag2)
+            for amount, item in enumerate(
+                (ingredient, ingredient2, ingredient3), start=1
+            ):
+                recipe.recipe_ingredients.create(
+                    ingredient=item, amount=amount
+                )
+
+        def count_queries(limit):
+            url = self.urls['recipe_list'] + f'?limit={limit}'
+            with CaptureQueriesContext(connection) as context:
+                response = self.assert_status_code(
+                    200, client.get(url), url=url
+                )
+            assert len(response.data['results']) == limit
+            assert len(response.data['results'][0]['ingredients']) == 3
+            assert len(response.data['results'][0]['tags']) == 2
+            return len(context.captured_queries)
+
+        assert count_queries(2) == count_queries(10), (
+            'Количество запросов не должно зависеть от размера страницы'
+        )
+        # COUNT, рецепты с авторами, теги, ингредиенты с единицами
+        assert count_queries(10) == 4
+
+    def test_favorite_shopping_cart_toggle_queries(self, user_client, recipe):
+        """Test add/remove recipe costs a fixed number of statements"""
+
+        def recipe_queries(method, url):
+            with CaptureQueriesContext(connection) as context:
+                response = method(url)
+            return response, [
+                query['sql']
+                for query in context.captured_queries
+                # Аутентификация тоже выбирает поле users_user.recipes_count
+                if 'recipes_' in query['sql']
+                and 'authtoken_token' not in query['sql']
+            ]
+
+        for name, model, counter in (
+            ('favorites', Favorite, 'favorites_count'),
+            ('recipe_in_cart', ShoppingCart, 'in_carts_count'),
+        ):
+            url = self.urls[name].format(recipe_id=recipe.id)
+            response, queries = recipe_queries(user_client.post, url)
+            self.assert_status_code(201, response, url=url)
+            # Проверка рецепта, INSERT и обновление счетчика рецепта
+            assert len(queries) == 3, queries
+            recipe.refresh_from_db()
+            assert getattr(recipe, counter) == 1
+            response, queries = recipe_queries(user_client.post, url)
+            self.assert_status_code(400, response, url=url)
+            response, queries = recipe_queries(user_client.delete, url)
+            self.assert_status_code(204, response, url=url)
+            # Выборка удаляемых строк для сигналов, DELETE и счетчик
+            assert len(queries) == 3, queries
+            assert not model.objects.exists()
+            recipe.refresh_from_db()
+            assert getattr(recipe, counter) == 0
+
+    def test_bulk_favorite_shopping_cart(self, user_client, user, recipe):
+        """Test bulk add and remove of favorites and shopping cart"""
+        other_recipe = Recipe.objects.create(
+            name='Other recipe', author=user, cooking_time=5
+        )
+        for name, model, counter in (
+            ('favorites_bulk', Favorite, 'favorites_count'),
+            ('shopping_cart_bulk', ShoppingCart, 'in_carts_count'),
+        ):
+            url = self.urls[name]
+            model.objects.create(user=user, recipe=recipe)
+            self.assert_status_code(
+                400,
+                user_client.post(url, {'recipes': []}, format='json'),
+                url=url,
+            )
+            response = self.assert_status_code(
+                200,
+                user_client.post(
+                    url,
+                    {'recipes': [recipe.id, other_recipe.id, 999999999]},
+                    format='json',
+                ),
+                url=url,
+            )
+            assert response.data['recipes'] == [
+                {'id': recipe.id, 'status': 'already_added'},
+                {'id': other_recipe.id, 'status': 'added'},
+                {'id': 999999999, 'status': 'not_found'},
+            ]
+            assert model.objects.filter(user=user).count() == 2
+            # bulk_create не отправляет сигналы, счетчик обновляет ручка
+            other_recipe.refresh_from_db()
+            assert getattr(other_recipe, counter) == 1
+
+            response = self.assert_status_code(
+                200,
+                user_client.delete(
+                    url, {'recipes': [recipe.id, 999999999]}, format='json'
+                ),
+                url=url,
+            )
+            assert response.data['recipes'] == [
+                {'id': recipe.id, 'status': 'removed'},
+                {'id': 999999999, 'status': 'not_added'},
+            ]
+            # Очистка всего списка только по явному флагу
+            for body in (None, {'recipe': [recipe.id]}, [recipe.id]):
+                self.assert_status_code(
+                    400, user_client.delete(url, body, format='json'), url=url
+                )
+            self.assert_status_code(
+                400,
+                user_client.delete(
+                    url, {'all': True, 'recipes': [recipe.id]}, format='json'
+                ),
+                url=url,
+            )
+            assert model.objects.filter(user=user).count() == 1
+            response = self.assert_status_code(
+                200, user_client.delete(url, {'all': True}, format='json'),
+                url=url,
+            )
+            assert response.data == {'deleted': 1}
+            assert not model.objects.filter(user=user).exists()
+
+    def test_bulk_favorite_concurrent_insert(
+        self, mocker, user_client, user, recipe
+    ):
+        """Test rows inserted by a concurrent request are counted once"""
+        bulk_create = Favorite.objects.bulk_create
+
+        def concurrent_bulk_create(objs, **kwargs):
+            # Параллельный запрос успевает добавить ту же строку
+            Favorite.objects.create(user=user, recipe=recipe)
+            return bulk_create(objs, **kwargs)
+
+        mocker.patch.object(
+            Favorite.objects, 'bulk_create', concurrent_bulk_create
+        )
+        url = self.urls['favorites_bulk']
+        self.assert_status_code(
+            200,
+            user_client.post(url, {'recipes': [recipe.id]}, format='json'),
+            url=url,
+        )
+        assert Favorite.objects.filter(user=user).count() == 1
+        recipe.refresh_from_db()
+        assert recipe.favorites_count == 1
+
+    def test_recipe_list_ordering(self, client, user, another_user):
+        """Test ?ordering=popular|trending|cooking_time"""
+        quick, popular, trending = (
+            Recipe.objects.create(
+                name=name, author=user, cooking_time=cooking_time
+            )
+            for name, cooking_time in (
+                ('quick', 5),
+                ('popular', 30),
+                ('trending', 20),
+            )
+        )
+        for favorite_user in (user, another_user):
+            Favorite.objects.create(user=favorite_user, recipe=popular)
+        Recipe.objects.filter(pk=trending.pk).update(trending_score=1.5)
+        url = self.urls['recipe_list']
+        for ordering, expected in (
+            ('popular', [popular, trending, quick]),
+            ('trending', [trending, popular, quick]),
+            ('cooking_time', [quick, trending, popular]),
+        ):
+            response = self.assert_status_code(
+                200, client.get(url, {'ordering': ordering}), url=url
+            )
+            assert [
+                item['id'] for item in response.json()['results']
+            ] == [recipe.id for recipe in expected], ordering
+        self.assert_status_code(
+            400, client.get(url, {'ordering': 'name'}), url=url
+        )
+
+    def test_recipe_list_cursor_pagination(self, client, user):
+        """Test opt-in keyset pagination of recipes"""
+        recipes = [
+            Recipe.objects.create(
+                name=f'recipe {i}', author=user, cooking_time=10
+            )
+            for i in range(5)
+        ]
+        # Одинаковая дата добавления: порядок определяет id
+        Recipe.objects.filter(pk__in=[r.pk for r in recipes[:3]]).update(
+            date_added=recipes[0].date_added
+        )
+        url = self.urls['recipe_list'] + '?cursor=&limit=2'
+        seen = []
+        while url:
+            response = self.assert_status_code(200, client.get(url), url=url)
+            assert set(response.data) == {'next', 'results'}
+            seen += [item['id'] for item in response.data['results']]
+            url = response.data['next']
+        assert seen == [
+            recipe.id
+            for recipe in Recipe.objects.order_by('-date_added', '-id')
+        ]
+        url = self.urls['recipe_list']
+        self.assert_status_code(
+            404, client.get(url, {'cursor': 'garbage'}), url=url
+        )
+        # Без параметра cursor остается постраничная пагинация
+        response = self.assert_status_code(200, client.get(url), url=url)
+        assert response.data['count'] == 5
+
+    def test_recipe_list_approximate_count(
+        self, client, user_client, user, recipe, settings
+    ):
+        """Test cached counts with PAGINATION_COUNT_MODE = 'approximate'"""
+        cache.clear()
+        settings.PAGINATION_COUNT_MODE = 'approximate'
+        url = self.urls['recipe_list']
+
+        def get_count(api_client, params=None):
+            with CaptureQueriesContext(connection) as context:
+                response = self.assert_status_code(
+                    200, api_client.get(url, params), url=url
+                )
+            counts = [
+                query for query in context.captured_queries
+                if 'COUNT(' in query['sql']
+            ]
+            return response.data['count'], len(counts)
+
+        assert get_count(client) == (1, 1)
+        Recipe.objects.create(name='new', author=user, cooking_time=5)
+        # Количество берется из кэша, в том числе для другого пользователя
+        assert get_count(client) == (1, 0)
+        assert get_count(user_client) == (1, 0)
+        # Другой набор фильтров считается отдельно
+        assert get_count(client, {'author': user.id}) == (2, 1)
+        settings.PAGINATION_COUNT_MODE = 'exact'
+        assert get_count(client) == (2, 1)
+
+    def test_create_recipe_ingredient_queries(
+        self, user_client, measurement_unit, image_str, tag
+    ):
+        """Test recipe create costs the same queries for any ingredients"""
+        ingredients = [
+            Ingredient.objects.create(
+                name=f'ingredient {i}', measurement_unit=measurement_unit
+            )
+            for i in range(30)
+        ]
+        url = self.urls['recipe_list']
+
+        def create_recipe(ingredient_ids):
+            recipe_data = {
+                'name': 'test_recipe',
+                'text': 'test_text',
+                'cooking_time': 10,
+                'ingredients': [
+                    {'id': pk, 'amount': 5} for pk in ingredient_ids
+                ],
+                'image': image_str,
+                'tags': [tag.id],
+            }
+            with CaptureQueriesContext(connection) as context:
+                response = user_client.post(url, recipe_data, format='json')
+            return response, len(context.captured_queries)
+
+        ids = [ingredient.id for ingredient in ingredients]
+        response, few_queries = create_recipe(ids[:2])
+        self.assert_status_code(201, response, url=url)
+        response, many_queries = create_recipe(ids)
+        self.assert_status_code(201, response, url=url)
+        assert len(response.data['ingredients']) == 30
+        assert few_queries == many_queries
+
+        recipes_count = Recipe.objects.count()
+        response, _ = create_recipe([ids[0], 999999999])
+        self.assert_status_code(400, response, url=url)
+        assert '999999999' in str(response.data['ingredients'])
+        assert Recipe.objects.count() == recipes_count
+
+    def test_update_recipe_ingredients_diff(
+        self, user_client, recipe_with_ingredients, ingredient, ingredient2,
+        ingredient3, tag
+    ):
+        """Test recipe update writes only changed ingredient rows"""
+        url = self.urls['recipe_detail'].format(
+            recipe_id=recipe_with_ingredients.id
+        )
+        recipe_data = {
+            'name': 'renamed',
+            'text': 'test_text',
+            'cooking_time': 100,
+            'tags': [tag.id],
+            'ingredients': [
+                {'id': ingredient.id, 'amount': 100},
+                {'id': ingredient2.id, 'amount': 200},
+                {'id': ingredient3.id, 'amount': 300},
+            ],
+        }
+
+        def ingredient_writes(data):
+            with CaptureQueriesContext(connection) as context:
+                self.assert_status_code(
+                    200, user_client.patch(url, data, format='json'), url=url
+                )
+            return [
+                query['sql'].split()[0]
+                for query in context.captured_queries
+                if 'recipes_recipeingredient' in query['sql']
+                and not query['sql'].startswith('SELECT')
+            ]
+
+        untouched = list(
+            RecipeIngredient.objects.filter(
+                recipe=recipe_with_ingredients
+            ).values_list('pk', flat=True)
+        )
+        # Изменилось только название: строки ингредиентов не пишутся
+        assert ingredient_writes(recipe_data) == []
+        recipe_data['ingredients'] = [
+            {'id': ingredient.id, 'amount': 100},
+            {'id': ingredient2.id, 'amount': 250},
+        ]
+        assert ingredient_writes(recipe_data) == ['DELETE', 'UPDATE']
+        rows = RecipeIngredient.objects.filter(recipe=recipe_with_ingredients)
+        assert dict(rows.values_list('ingredient_id', 'amount')) == {
+            ingredient.id: 100,
+            ingredient2.id: 250,
+        }
+        assert set(rows.values_list('pk', flat=True)) < set(untouched)
+        recipe_data['ingredients'].append({'id': ingredient3.id, 'amount': 1})
+        assert ingredient_writes(recipe_data) == ['INSERT']
+
+    def test_update_recipe_keeps_counters(
+        self, mocker, user_client, another_user, recipe_with_ingredients,
+        ingredient, tag
+    ):
+        """Test recipe edit does not overwrite a concurrent favorite"""
+        recipe = recipe_with_ingredients
+        validate_ingredients = RecipeCreateSerializer.validate_ingredients
+
+        def concurrent_favorite(serializer, value):
+            # Рецепт уже загружен вьюсетом, параллельный запрос
+            # добавляет его в избранное
+            Favorite.objects.create(user=another_user, recipe=recipe)
+            return validate_ingredients(serializer, value)
+
+        mocker.patch.object(
+            RecipeCreateSerializer, 'validate_ingredients', concurrent_favorite
+        )
+        url = self.urls['recipe_detail'].format(recipe_id=recipe.id)
+        recipe_data = {
+            'name': 'renamed',
+            'text': 'test_text',
+            'cooking_time': 10,
+            'tags': [tag.id],
+            'ingredients': [{'id': ingredient.id, 'amount': 1}],
+        }
+        self.assert_status_code(
+            200, user_client.patch(url, recipe_data, format='json'), url=url
+        )
+        recipe.refresh_from_db()
+        assert recipe.name == 'renamed'
+        assert recipe.favorites_count == 1
+
+    def test_create_recipe_multipart(
+        self, settings, tmp_path, user_client, ingredient, ingredient2,
+        image_str, tag
+    ):
+        """Test recipe create from multipart/form-data with an image file"""
+        settings.MEDIA_ROOT = tmp_path
+        url = self.urls['recipe_list']
+        image = SimpleUploadedFile(
+            'photo.png',
+            base64.b64decode(image_str.split(',')[1]),
+            content_type='image/png',
+        )
+        recipe_data = {
+            'name': 'multipart recipe',
+            'text': 'test_text',
+            'cooking_time': 10,
+            'ingredients': json.dumps(
+                [
+                    {'id': ingredient.id, 'amount': 1},
+                    {'id': ingredient2.id, 'amount': 2},
+                ]
+            ),
+            'tags': [tag.id],
+            'image': image,
+        }
+        response = self.assert_status_code(
+            201,
+            user_client.post(url, recipe_data, format='multipart'),
+            url=url,
+        )
+        assert len(response.data['ingredients']) == 2
+        assert response.data['tags'][0]['id'] == tag.id
+        recipe = Recipe.objects.get(id=response.data['id'])
+        assert recipe.image.name.startswith('recipes/images/photo')
+        recipe_data['ingredients'] = 'not json'
+        self.assert_status_code(
+            400,
+            user_client.post(url, recipe_data, format='multipart'),
+            url=url,
+        )
+
+    def test_upload_recipe_image(
+        self, settings, tmp_path, client, user_client, admin_client,
+        ingredient, image_str, tag
+    ):
+        """Test image upload endpoint returns a handle usable as image"""
+        settings.MEDIA_ROOT = tmp_path
+        url = self.urls['recipe_image_upload']
+
+        def upload():
+            image = SimpleUploadedFile(
+                'upload.png',
+                base64.b64decode(image_str.split(',')[1]),
+                content_type='image/png',
+            )
+            return user_client.post(url, {'image': image}, format='multipart')
+
+        self.assert_status_code(
+            401, client.post(url, {}, format='multipart'), url=url
+        )
+        response = self.assert_status_code(201, upload(), url=url)
+        assert response.data['url'].endswith('.png')
+        handle = response.data['image']
+
+        recipe_url = self.urls['recipe_list']
+        recipe_data = {
+            'name': 'uploaded image',
+            'text': 'test_text',
+            'cooking_time': 10,
+            'ingredients': [{'id': ingredient.id, 'amount': 1}],
+            'tags': [tag.id],
+            'image': handle,
+        }
+        # Идентификатор действителен только для загрузившего пользователя
+        self.assert_status_code(
+            400,
+            admin_client.post(recipe_url, recipe_data, format='json'),
+            url=recipe_url,
+        )
+        response = self.assert_status_code(
+            201,
+            user_client.post(recipe_url, recipe_data, format='json'),
+            url=recipe_url,
+        )
+        recipe = Recipe.objects.get(id=response.data['id'])
+        assert response.data['image'].endswith(recipe.image.name)
+        recipe_data['image'] = handle + 'x'
+        self.assert_status_code(
+            400,
+            user_client.post(recipe_url, recipe_data, format='json'),
+            url=recipe_url,
+        )
+
+    def test_schema(self, client):
+        """Test OpenAPI schema is generated for all endpoints"""
+        url = '/swagger/?format=openapi'
+        response = self.assert_status_code(200, client.get(url), url=url)
+        assert '/recipes/images/' in response.json()['paths']
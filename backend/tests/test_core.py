@@ -1,8 +1,12 @@
+from io import StringIO
+import json
 from pathlib import Path
 
 import pytest
 
-from core.management.commands.load_ingredients import Command
+from core.management.commands.load_ingredients import Command, iter_json_array
+from recipes.models import Ingredient, Unit
+from django.core.management import call_command
 from django.core.management.base import CommandError
 
 
@@ -34,31 +38,74 @@ def test_corrupted_file(mocker):
         Command().handle()
 
 
+@pytest.fixture
+def write_file(tmp_path):
+    def write(name, content):
+        path = tmp_path / name
+        path.write_text(content, encoding='utf-8')
+        return path
+
+    return write
+
+
+def assert_success(out, found, new):
+    lines = out.strip().splitlines()
+    assert lines[0] == (
+        'Команда выполнена успешно. '
+        f'Найдено {found} ингредиентов. Из них новых '
+        f'{new} добавлено в базу данных.'
+    ), 'Неверное количество обработанных элементов'
+    assert lines[1].endswith('строк/с.'), 'Должна выводиться скорость'
+
+
 @pytest.mark.django_db(transaction=True)
-def test_wrong_json_content(mocker, capfd, wrong_json):
+def test_wrong_json_content(capfd, wrong_json, write_file):
     """"Если в json-файле один из элементов неверный, должны быть обработаны
     только верные элементы"""
-    mocker.patch('json.loads', return_value=wrong_json)
-    Command().handle()
+    path = write_file('ingredients.json', json.dumps(wrong_json))
+    Command().handle(path=path)
     out, err = capfd.readouterr()
-    assert out.strip() == (
-        'Команда выполнена успешно. '
-        'Найдено 1 ингредиентов. Из них новых '
-        '1 добавлено в базу данных.'
-    ), 'Неверное количество обработанных элементов'
+    assert_success(out, found=1, new=1)
 
 
 @pytest.mark.django_db(transaction=True)
-def test_empty_json(mocker, capfd):
+def test_empty_json(capfd, write_file):
     """Если json пустой"""
-    mocker.patch('json.loads', return_value=[])
-    Command().handle()
+    Command().handle(path=write_file('ingredients.json', '[]'))
     out, err = capfd.readouterr()
-    assert out.strip() == (
-        'Команда выполнена успешно. '
-        'Найдено 0 ингредиентов. Из них новых '
-        '0 добавлено в базу данных.'
-    ), 'Ошибка при обработке пустого json-файла'
+    assert_success(out, found=0, new=0)
+
+
+@pytest.mark.django_db(transaction=True)
+def test_load_csv_in_batches(capfd, write_file, measurement_unit):
+    """CSV загружается пачками, единицы измерения создаются один раз"""
+    path = write_file(
+        'ingredients.csv',
+        'абрикос,г\nбанан,шт\nбанан,шт\nвишня,г\nгруша,m.unit\nплохая строка\n',
+    )
+    Command().handle(path=path, batch_size=2)
+    out, err = capfd.readouterr()
+    assert_success(out, found=5, new=4)
+    assert set(Unit.objects.values_list('name', flat=True)) == {
+        'г',
+        'шт',
+        'm.unit',
+    }
+    assert Ingredient.objects.get(name='груша').measurement_unit == (
+        measurement_unit
+    )
+
+
+def test_iter_json_array_small_chunks():
+    """JSON разбирается потоково при любом размере части файла"""
+    data = [{'name': f'ингредиент {i}', 'measurement_unit': 'г'} for i in range(20)]
+    content = json.dumps(data, ensure_ascii=False, indent=2)
+    for chunk_size in (1, 7, 64, len(content)):
+        assert list(
+            iter_json_array(StringIO(content), chunk_size=chunk_size)
+        ) == data
+    with pytest.raises(json.JSONDecodeError):
+        list(iter_json_array(StringIO(content[:-10]), chunk_size=7))
 
 
 @pytest.mark.django_db(transaction=True)
@@ -73,3 +120,86 @@ def test_not_created_item(mocker, capfd):
     assert out.strip() == (
         f'Ошибка во время заполнения базы данных значениями mocked error'
     )
+
+
+@pytest.mark.django_db(transaction=True)
+def test_benchmark_ingredient_search(capsys, ingredient, ingredient2):
+    """Замер поиска ингредиентов выводит p50 и p99"""
+    call_command('benchmark_ingredient_search', requests=10)
+    out, err = capsys.readouterr()
+    assert 'p50:' in out and 'p99:' in out
+
+
+@pytest.mark.django_db(transaction=True)
+def test_benchmark_ingredient_search_empty():
+    """Замер без ингредиентов в базе выбрасывает исключение"""
+    with pytest.raises(CommandError):
+        call_command('benchmark_ingredient_search')
+
+
+def test_pdf_fonts_registered_once(mocker):
+    """Фонты и стили PDF создаются один раз на процесс"""
+    from core.generate_pdf import PDFFile
+
+    first = PDFFile()
+    register_fonts = mocker.spy(PDFFile, 'register_fonts')
+    second = PDFFile()
+    assert register_fonts.call_count == 0
+    assert first.styles is second.styles
+    second.add_item(['Ингредиент', 1, 'г'])
+    assert second.get_content().startswith(b'%PDF')
+
+
+@pytest.mark.django_db(transaction=True)
+def test_sync_ingredients(
+    capfd, write_file, recipe, ingredient, ingredient2, ingredient3
+):
+    """Синхронизация добавляет, обновляет и удаляет только нужное"""
+    recipe.recipe_ingredients.create(ingredient=ingredient3, amount=1)
+    path = write_file(
+        'ingredients.json',
+        json.dumps(
+            [
+                {'name': ingredient.name, 'measurement_unit': 'г'},
+                {'name': 'новый', 'measurement_unit': 'шт'},
+            ]
+        ),
+    )
+    Command().handle(path=path, sync=True, delete=True, dry_run=True)
+    out, err = capfd.readouterr()
+    assert out.strip() == (
+        'Пробный запуск, изменения не сохранены. '
+        'Найдено 2 ингредиентов. Новых 1, изменена единица измерения у 1, '
+        'отсутствуют в файле 2, удалено 1, используются в рецептах и не '
+        'удалены 1.'
+    )
+    assert Ingredient.objects.count() == 3
+    assert not Unit.objects.filter(name='г').exists()
+
+    Command().handle(path=path, sync=True, delete=True)
+    out, err = capfd.readouterr()
+    assert out.strip().startswith('Найдено 2 ингредиентов. Новых 1')
+    assert set(
+        Ingredient.objects.values_list('id', 'name', 'measurement_unit__name')
+    ) == {
+        (ingredient.id, ingredient.name, 'г'),
+        (ingredient3.id, ingredient3.name, ingredient3.measurement_unit.name),
+        (Ingredient.objects.get(name='новый').id, 'новый', 'шт'),
+    }
+
+    Command().handle(path=path, sync=True)
+    out, err = capfd.readouterr()
+    assert 'Новых 0, изменена единица измерения у 0' in out
+
+
+@pytest.mark.django_db
+def test_sync_options_require_sync(write_file):
+    """--dry-run и --delete без --sync не загружают файл"""
+    path = write_file(
+        'ingredients.json',
+        json.dumps([{'name': 'новый', 'measurement_unit': 'шт'}]),
+    )
+    for option in ('--dry-run', '--delete'):
+        with pytest.raises(CommandError, match='--sync'):
+            call_command('load_ingredients', f'--path={path}', option)
+    assert not Ingredient.objects.exists()
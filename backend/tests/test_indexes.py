@@ -0,0 +1,119 @@
+import re
+
+from django.db import connection, transaction
+
+import pytest
+
+from api.filters import RecipeFilterSet
+from recipes.models import Favorite, Recipe, RecipeIngredient, ShoppingCart
+from recipes.services import get_shopping_cart_ingredients
+from users.models import Subscription, User
+
+pytestmark = [
+    pytest.mark.django_db,
+    pytest.mark.skipif(
+        connection.vendor != 'postgresql',
+        reason='Планы запросов проверяются только на PostgreSQL',
+    ),
+]
+
+
+def explain(queryset):
+    """
+    План запроса с запретом последовательного сканирования и отдельной
+    сортировки: на маленьких тестовых таблицах планировщик иначе выбирает
+    Seq Scan или Bitmap Scan с Sort, а нужно проверить, что для запроса
+    есть подходящий индекс.
+    """
+    with transaction.atomic(), connection.cursor() as cursor:
+        cursor.execute('SET LOCAL enable_seqscan = off')
+        cursor.execute('SET LOCAL enable_sort = off')
+        return queryset.explain()
+
+
+def assert_uses_indexes(queryset, *index_names, ordered=False):
+    """
+    Каждый индекс должен сканироваться в плане. ordered: порядок строк
+    дает сам индекс, без отдельной сортировки.
+    """
+    plan = explain(queryset)
+    for index_name in index_names:
+        name = f'"{index_name}"' if ' ' in index_name else index_name
+        pattern = rf'Scan (Backward )?(using|on) {re.escape(name)}(?!\w)'
+        assert re.search(pattern, plan), (
+            f'Запрос должен использовать индекс {index_name}:\n{plan}'
+        )
+    if ordered:
+        assert 'Sort' not in plan, (
+            f'Порядок должен обеспечиваться индексом:\n{plan}'
+        )
+
+
+def constraint_name(model):
+    return str(model._meta.constraints[0].name)
+
+
+class TestIndexes:
+    """Тест использования индексов основными запросами API"""
+
+    def test_recipe_list(self, recipe):
+        assert_uses_indexes(
+            Recipe.objects.order_by('-date_added', '-id')[:6],
+            'recipe_date_idx',
+            ordered=True,
+        )
+        for ordering, index_name in (
+            ('popular', 'recipe_popular_idx'),
+            ('trending', 'recipe_trending_idx'),
+            ('cooking_time', 'recipe_cooking_time_idx'),
+        ):
+            assert_uses_indexes(
+                Recipe.objects.order_by(
+                    *RecipeFilterSet.ORDERINGS[ordering]
+                )[:6],
+                index_name,
+                ordered=True,
+            )
+
+    def test_author_recipes(self, user, recipe):
+        author_recipes = Recipe.objects.filter(author=user)
+        assert_uses_indexes(
+            author_recipes.order_by('-date_added', '-id')[:3],
+            'recipe_author_date_idx',
+            ordered=True,
+        )
+        # Так рецепты подписок выбираются через prefetch_related
+        assert_uses_indexes(
+            Recipe.objects.latest_per_author(3).filter(author__in=[user]),
+            'recipe_author_date_idx',
+        )
+
+    def test_user_flags(self, user, recipe, favorite):
+        # Как в подзапросах EXISTS флагов, без сортировки модели
+        assert_uses_indexes(
+            Favorite.objects.filter(user=user, recipe=recipe).order_by(),
+            constraint_name(Favorite),
+        )
+        assert_uses_indexes(
+            ShoppingCart.objects.filter(user=user, recipe=recipe).order_by(),
+            constraint_name(ShoppingCart),
+        )
+        assert_uses_indexes(
+            Favorite.objects.filter(user=user).order_by('-date_added')[:6],
+            'favorite_user_date_idx',
+            ordered=True,
+        )
+
+    def test_shopping_cart_aggregation(self, user, shopping_cart):
+        assert_uses_indexes(
+            get_shopping_cart_ingredients(user),
+            constraint_name(ShoppingCart),
+            constraint_name(RecipeIngredient),
+        )
+
+    def test_subscriptions(self, user, another_user):
+        Subscription.objects.create(user=user, subscription=another_user)
+        assert_uses_indexes(
+            User.objects.filter(subscribers__user=user),
+            constraint_name(Subscription),
+        )
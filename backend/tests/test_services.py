@@ -0,0 +1,269 @@
+from datetime import timedelta
+from io import BytesIO, StringIO
+
+from django.conf import settings
+from django.core.files.base import ContentFile
+from django.core.files.storage import default_storage
+from django.core.management import call_command
+from django.utils import timezone
+
+from PIL import Image
+import pytest
+
+from api.serializers.recipe_serializers import RecipeSubscribeSerializer
+from recipes import images
+from recipes.models import Favorite, Recipe, ShoppingCart
+from recipes.services import (
+    get_shopping_cart_ingredients,
+    update_trending_scores,
+)
+from users.models import Subscription
+
+
+@pytest.mark.django_db
+class TestShoppingCartIngredients:
+    """Тест подсчета ингредиентов списка покупок"""
+
+    def test_same_ingredient_in_many_recipes(
+        self,
+        user,
+        another_user,
+        ingredient,
+        ingredient2,
+        ingredient3,
+        django_assert_num_queries,
+    ):
+        recipes = [
+            Recipe.objects.create(
+                name=f'recipe {i}', author=user, cooking_time=10
+            )
+            for i in range(5)
+        ]
+        for amount, recipe in enumerate(recipes, start=1):
+            recipe.recipe_ingredients.create(
+                ingredient=ingredient, amount=amount
+            )
+            recipe.recipe_ingredients.create(
+                ingredient=ingredient2, amount=10
+            )
+            ShoppingCart.objects.create(user=user, recipe=recipe)
+        # Ингредиент рецепта не из списка покупок не учитывается
+        recipes[0].recipe_ingredients.create(
+            ingredient=ingredient3, amount=100
+        )
+        ShoppingCart.objects.filter(recipe=recipes[0]).delete()
+        # Чужой список покупок не учитывается
+        ShoppingCart.objects.create(user=another_user, recipe=recipes[0])
+
+        with django_assert_num_queries(1):
+            cart = list(get_shopping_cart_ingredients(user))
+        assert cart == [
+            {
+                'ingredient': ingredient.id,
+                'name': ingredient.name,
+                'measurement_unit': ingredient.measurement_unit.name,
+                'amount': 2 + 3 + 4 + 5,
+            },
+            {
+                'ingredient': ingredient2.id,
+                'name': ingredient2.name,
+                'measurement_unit': ingredient2.measurement_unit.name,
+                'amount': 10 * 4,
+            },
+        ]
+
+    def test_empty_cart(self, user, recipe_with_ingredients):
+        assert not get_shopping_cart_ingredients(user).exists()
+
+
+@pytest.mark.django_db
+class TestCounters:
+    """Тест денормализованных счетчиков рецептов и пользователей"""
+
+    def test_counters_follow_changes(self, user, another_user, recipe):
+        Favorite.objects.create(user=user, recipe=recipe)
+        Favorite.objects.create(user=another_user, recipe=recipe)
+        ShoppingCart.objects.create(user=user, recipe=recipe)
+        Subscription.objects.create(user=another_user, subscription=user)
+        recipe.refresh_from_db()
+        user.refresh_from_db()
+        assert (recipe.favorites_count, recipe.in_carts_count) == (2, 1)
+        assert (user.recipes_count, user.subscribers_count) == (1, 1)
+
+        Favorite.objects.filter(user=user).delete()
+        Subscription.objects.all().delete()
+        recipe.refresh_from_db()
+        assert recipe.favorites_count == 1
+        recipe.delete()
+        user.refresh_from_db()
+        assert (user.recipes_count, user.subscribers_count) == (0, 0)
+
+    def test_stale_save_keeps_counters(self, user, another_user, recipe):
+        stale_recipe = Recipe.objects.get(pk=recipe.pk)
+        stale_user = type(user).objects.get(pk=user.pk)
+        # Параллельный запрос меняет счетчики после загрузки объектов
+        Favorite.objects.create(user=another_user, recipe=recipe)
+        Recipe.objects.create(name='second', author=user, cooking_time=5)
+        stale_recipe.name = 'renamed'
+        stale_recipe.save()
+        stale_user.set_password('NewPassword123')
+        stale_user.save()
+        recipe.refresh_from_db()
+        user.refresh_from_db()
+        assert recipe.name == 'renamed'
+        assert recipe.favorites_count == 1
+        assert user.recipes_count == 2
+        assert user.check_password('NewPassword123')
+
+    def test_recount_counters(self, user, another_user, recipe):
+        Favorite.objects.bulk_create(
+            [
+                Favorite(user=user, recipe=recipe),
+                Favorite(user=another_user, recipe=recipe),
+            ]
+        )
+        Recipe.objects.update(in_carts_count=5)
+        call_command('recount_counters')
+        recipe.refresh_from_db()
+        user.refresh_from_db()
+        another_user.refresh_from_db()
+        assert (recipe.favorites_count, recipe.in_carts_count) == (2, 0)
+        assert user.recipes_count == 1
+        assert another_user.recipes_count == 0
+
+
+@pytest.mark.django_db
+class TestTrending:
+    """Тест оценки trending"""
+
+    def test_update_trending_scores(self, user, another_user, recipe):
+        now = timezone.now()
+        stale = Recipe.objects.create(
+            name='stale', author=user, cooking_time=10
+        )
+        Favorite.objects.create(user=user, recipe=recipe)
+        ShoppingCart.objects.create(user=another_user, recipe=recipe)
+        old = Favorite.objects.create(user=user, recipe=stale)
+        # Добавление за пределами окна не учитывается
+        Favorite.objects.filter(pk=old.pk).update(
+            date_added=now - timedelta(days=settings.TRENDING_WINDOW_DAYS + 1)
+        )
+        Recipe.objects.filter(pk=stale.pk).update(trending_score=3)
+
+        later = now + timedelta(hours=settings.TRENDING_HALF_LIFE_HOURS)
+        assert update_trending_scores(now=later) == 1
+        recipe.refresh_from_db()
+        stale.refresh_from_db()
+        # Два добавления, каждое потеряло половину веса
+        assert recipe.trending_score == pytest.approx(1, rel=1e-3)
+        assert stale.trending_score == 0
+
+
+@pytest.mark.django_db
+class TestImageVariants:
+    """Тест уменьшенных копий картинки рецепта"""
+
+    @pytest.fixture(autouse=True)
+    def media(self, settings, tmp_path):
+        settings.MEDIA_ROOT = tmp_path
+        settings.IMAGE_VARIANTS_ASYNC = False
+        settings.IMAGE_VARIANT_WIDTHS = (320, 640, 1280)
+
+    @staticmethod
+    def make_image(name, size=(700, 350)):
+        buffer = BytesIO()
+        Image.new('RGB', size, '#ff8800').save(buffer, 'PNG')
+        return ContentFile(buffer.getvalue(), name=name)
+
+    def test_variants_after_upload(
+        self, user, django_capture_on_commit_callbacks
+    ):
+        with django_capture_on_commit_callbacks(execute=True):
+            recipe = Recipe.objects.create(
+                name='photo',
+                author=user,
+                cooking_time=10,
+                image=self.make_image('photo.png'),
+            )
+        recipe.refresh_from_db()
+        variants = recipe.image_variants
+        assert variants['source'] == recipe.image.name
+        for extension, image_format in (('webp', 'WEBP'), ('jpeg', 'JPEG')):
+            # 1280 больше исходной ширины и пропускается
+            assert [width for width, _ in variants[extension]] == [320, 640]
+            for width, name in variants[extension]:
+                assert name.startswith('recipes/images/photo_')
+                with default_storage.open(name) as variant:
+                    with Image.open(variant) as image:
+                        assert image.format == image_format
+                        assert image.size == (width, width // 2)
+
+        data = RecipeSubscribeSerializer(recipe).data
+        assert data['image_thumb'] == default_storage.url(
+            variants['jpeg'][0][1]
+        )
+        assert data['image_srcset']['webp'].endswith(' 640w')
+        assert data['image_srcset']['webp'].count('w, ') == 1
+
+        old_names = [name for _, name in variants['webp']]
+        with django_capture_on_commit_callbacks(execute=True):
+            recipe.image = self.make_image('other.png')
+            recipe.save()
+        recipe.refresh_from_db()
+        assert recipe.image_variants['source'] == recipe.image.name
+        assert not any(default_storage.exists(name) for name in old_names)
+
+    def test_stale_save_keeps_variants(
+        self, mocker, user, django_capture_on_commit_callbacks
+    ):
+        render_variants = mocker.spy(images, 'render_variants')
+        with django_capture_on_commit_callbacks() as callbacks:
+            recipe = Recipe.objects.create(
+                name='photo',
+                author=user,
+                cooking_time=10,
+                image=self.make_image('photo.png'),
+            )
+        # Фоновая задача завершается после загрузки рецепта для правки
+        for callback in callbacks:
+            callback()
+        with django_capture_on_commit_callbacks(execute=True):
+            recipe.name = 'renamed'
+            recipe.save()
+        recipe.refresh_from_db()
+        assert render_variants.call_count == 1
+        assert recipe.name == 'renamed'
+        assert recipe.image_variants['source'] == recipe.image.name
+        for _width, name in recipe.image_variants['webp']:
+            assert default_storage.exists(name)
+
+        # Варианты, которые уже создаются, не ставятся в очередь повторно
+        recipe.image = self.make_image('other.png')
+        recipe.save()
+        key = (recipe.id, recipe.image.name)
+        images.pending.add(key)
+        images.schedule_image_variants(*key)
+        assert render_variants.call_count == 1
+        images.pending.discard(key)
+        images.schedule_image_variants(*key)
+        assert render_variants.call_count == 2
+        assert key not in images.pending
+
+    def test_small_image_and_command(self, user):
+        recipe = Recipe.objects.create(
+            name='small',
+            author=user,
+            cooking_time=10,
+            image=self.make_image('small.png', size=(100, 100)),
+        )
+        assert RecipeSubscribeSerializer(recipe).data['image_thumb'] == (
+            recipe.image.url
+        )
+        call_command('generate_image_variants', stdout=StringIO())
+        recipe.refresh_from_db()
+        assert recipe.image_variants == {
+            'webp': [],
+            'jpeg': [],
+            'source': recipe.image.name,
+        }
+        assert RecipeSubscribeSerializer(recipe).data['image_srcset'] == {}
@@ -1,5 +1,7 @@
 import pytest
 from django.contrib.auth import get_user_model
+from django.db import connection
+from django.test.utils import CaptureQueriesContext
 from rest_framework import status
 
 from users.models import Subscription
@@ -104,4 +106,108 @@ class TestAPISubscriptions(APITestBase):
         # Delete subscription to non-existent user
         self.assert_status_code(
             404, user_client.delete(wrong_url), url=wrong_url
-        )
\ No newline at end of file
+        )
+
+    def test_is_subscribed_queries(self, user_client, user, django_user_model):
+        """Test subscriptions are loaded once per request"""
+        authors = [
+            django_user_model.objects.create_user(
+                username=f'author_{i}',
+                email=f'author{i}@fake.mail',
+                password='123456Qq',
+            )
+            for i in range(6)
+        ]
+        for author in authors[:3]:
+            Subscription.objects.create(user=user, subscription=author)
+
+        for url, expected_queries in (
+            (self.urls['users'], 1),
+            # Для /subscriptions/ дополнительно считается и выбирается
+            # сама страница подписок
+            (self.urls['subscriptions'], 3),
+        ):
+            with CaptureQueriesContext(connection) as context:
+                response = self.assert_status_code(
+                    200, user_client.get(url), url=url
+                )
+            subscription_queries = [
+                query
+                for query in context.captured_queries
+                if 'users_subscription' in query['sql']
+            ]
+            assert len(subscription_queries) == expected_queries, (
+                f'При запросе `{url}` подписки должны загружаться один раз'
+            )
+            subscribed = {
+                item['id']: item['is_subscribed']
+                for item in response.data['results']
+            }
+            for author in authors[:3]:
+                assert subscribed[author.id] is True
+        assert subscribed.keys() == {author.id for author in authors[:3]}
+
+    def test_subscriptions_recipes_limit(
+        self, user_client, user, another_user, some_users
+    ):
+        """Test recipes_limit bounds recipes preview of each author"""
+        from recipes.models import Recipe
+
+        authors = [another_user, *some_users]
+        for author in authors:
+            Subscription.objects.create(user=user, subscription=author)
+            for i in range(3):
+                Recipe.objects.create(
+                    name=f'recipe {i}', author=author, cooking_time=10
+                )
+
+        def get_subscriptions(url):
+            with CaptureQueriesContext(connection) as context:
+                response = self.assert_status_code(
+                    200, user_client.get(url), url=url
+                )
+            return response.data['results'], len(context.captured_queries)
+
+        url = self.urls['subscriptions'] + '?recipes_limit=2'
+        results, queries = get_subscriptions(url)
+        assert len(results) == len(authors)
+        for item in results:
+            assert len(item['recipes']) == 2
+            assert item['recipes_count'] == 3
+            expected_ids = list(
+                Recipe.objects.filter(author_id=item['id']).values_list(
+                    'id', flat=True
+                )[:2]
+            )
+            assert [
+                recipe['id'] for recipe in item['recipes']
+            ] == expected_ids, 'Должны выводиться последние рецепты автора'
+        # Количество запросов не зависит от числа авторов
+        _, single_page_queries = get_subscriptions(url + '&limit=1')
+        assert queries == single_page_queries
+
+        results, _ = get_subscriptions(self.urls['subscriptions'])
+        assert all(len(item['recipes']) == 3 for item in results)
+
+    def test_subscriptions_cursor_pagination(
+        self, user_client, user, another_user, some_users
+    ):
+        """Test ?cursor= walks subscriptions without COUNT"""
+        authors = [another_user, *some_users]
+        for author in authors:
+            Subscription.objects.create(user=user, subscription=author)
+        url = self.urls['subscriptions'] + '?cursor=&limit=2'
+        seen = []
+        while url:
+            with CaptureQueriesContext(connection) as context:
+                response = self.assert_status_code(
+                    200, user_client.get(url), url=url
+                )
+            assert not any(
+                'COUNT(' in query['sql'] for query in context.captured_queries
+            )
+            assert 'count' not in response.data
+            assert len(response.data['results']) <= 2
+            seen += [item['id'] for item in response.data['results']]
+            url = response.data['next']
+        assert seen == sorted((author.id for author in authors), reverse=True)
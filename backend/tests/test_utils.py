@@ -1,7 +1,16 @@
+import base64
+
 import pytest
-from django.core.files.base import ContentFile
+from django.conf import settings
+from django.core.cache import cache
+from django.core.files.base import File
+from django.db import connection
+from django.test.utils import CaptureQueriesContext
+from rest_framework.exceptions import ValidationError
 
 from api.fields import Base64ImageField
+from api.filters import get_tag_map
+from recipes.models import Ingredient, Recipe, ShoppingCart
 from tests.common import APITestBase
 
 
@@ -9,7 +18,45 @@ class TestUtils(APITestBase):
     def test_image_field(self, image_str):
         """Test Base64ImageField correctly converts base64 string to image"""
         field = Base64ImageField()
-        assert isinstance(field.to_internal_value(image_str), ContentFile)
+        image = field.to_internal_value(image_str)
+        assert isinstance(image, File)
+        assert image.name == 'temp.png'
+        content = base64.b64decode(image_str.split(',')[1])
+        assert image.size == len(content)
+        assert image.read() == content
+
+    def test_image_field_spools_to_disk(self, image_str, settings):
+        """Test large decoded images are kept in a temporary file"""
+        settings.FILE_UPLOAD_MAX_MEMORY_SIZE = 10
+        image = Base64ImageField().to_internal_value(image_str)
+        assert image.file._rolled
+        assert image.read() == base64.b64decode(image_str.split(',')[1])
+
+    def test_image_field_limits(self, image_str, settings):
+        """Test Base64ImageField rejects oversized and broken payloads"""
+        field = Base64ImageField()
+        settings.RECIPE_IMAGE_MAX_SIZE = 10
+        # Отказ по длине строки, до декодирования
+        with pytest.raises(ValidationError, match='10 байт'):
+            field.to_internal_value('data:image/png;base64,' + 'A' * 10**6)
+        settings.RECIPE_IMAGE_MAX_SIZE = 10 * 1024 * 1024
+        # Строка с переносами декодируется так же, как без них
+        header, payload = image_str.split(',')
+        wrapped = '\n'.join(
+            payload[start:start + 20] for start in range(0, len(payload), 20)
+        )
+        image = field.to_internal_value(f'{header},{wrapped}\r\n')
+        assert image.read() == base64.b64decode(payload)
+        settings.RECIPE_IMAGE_MAX_PIXELS = 0
+        with pytest.raises(ValidationError, match='пикселей'):
+            field.to_internal_value(image_str)
+        for broken in (
+            'data:image/png,AAAA',
+            'data:image/png;base64,!!!!',
+            'data:image/png;base64,' + base64.b64encode(b'text').decode(),
+        ):
+            with pytest.raises(ValidationError):
+                field.to_internal_value(broken)
 
     @pytest.mark.django_db
     def test_ingredient_filter_by_name(self, client, ingredient, ingredient2):
@@ -30,6 +77,45 @@ class TestUtils(APITestBase):
         response = client.get(url)
         assert len(response.data) == 2
 
+    @pytest.mark.django_db
+    def test_ingredient_filter_prefix_first(
+        self, client, ingredient, ingredient2, measurement_unit
+    ):
+        """Test that prefix matches go before substring matches"""
+        Ingredient.objects.create(
+            name='ingredient without secret', measurement_unit=measurement_unit
+        )
+        url = self.urls['ingredient_list'] + '?name=ingredient'
+        response = self.assert_status_code(200, client.get(url), url=url)
+        assert [item['name'] for item in response.data] == [
+            'Ingredient without secret',
+            'Secret ingredient 1',
+            'Secret ingredient 2',
+        ], 'Совпадения по началу названия должны быть первыми'
+
+    @pytest.mark.django_db
+    def test_ingredient_search_index(
+        self, client, ingredient, ingredient2, django_assert_num_queries
+    ):
+        """Test ingredient search is served from memory and invalidated"""
+        url = self.urls['ingredient_list'] + '?name=secret'
+        self.assert_status_code(200, client.get(url), url=url)
+        with django_assert_num_queries(0):
+            response = self.assert_status_code(
+                200, client.get(url), url=url
+            )
+        assert [item['id'] for item in response.data] == [
+            ingredient.id,
+            ingredient2.id,
+        ]
+        ingredient2.name = 'Not so secret'
+        ingredient2.save()
+        response = self.assert_status_code(200, client.get(url), url=url)
+        assert [item['name'] for item in response.data] == [
+            'Secret ingredient 1',
+            'Not so secret',
+        ], 'Индекс должен перестраиваться после изменения ингредиента'
+
 
     def test_recipe_filter_by_tags(self, client, recipe, tag, tag2):
         """Test that recipe filter by tags works correctly"""
@@ -45,6 +131,18 @@ class TestUtils(APITestBase):
         assert len(response.data['results']) == 1
         assert response.data['results'][0]['tags'][0]['id'] == tag.id
 
+    def test_recipe_filter_by_new_tag(self, client, recipe, tag, tag2):
+        """Test a tag missing from a stale cached tag map is still found"""
+        recipe.tags.set([tag2])
+        # Словарь закэширован другим процессом до создания тега tag2
+        cache.set(settings.TAG_MAP_CACHE_KEY, {tag.slug: tag.id})
+        url = self.urls['recipe_list'] + '?tags=' + tag2.slug
+        response = self.assert_status_code(200, client.get(url), url=url)
+        assert [item['id'] for item in response.data['results']] == [
+            recipe.id
+        ]
+        assert get_tag_map() == {tag.slug: tag.id, tag2.slug: tag2.id}
+
     def test_filter_favorite_recipes(
         self, user_client, recipe, favorite, user
     ):
@@ -64,3 +162,51 @@ class TestUtils(APITestBase):
         self.assert_status_code(200, response, url=url)
         assert len(response.data['results']) == 1
         assert response.data['results'][0]['id'] == recipe.id
+
+    @pytest.mark.django_db
+    def test_recipe_filters_combine(
+        self, user_client, user, recipe, favorite, tag, tag2
+    ):
+        """Test tag, favorite and cart filters compose without DISTINCT"""
+        both_tags = Recipe.objects.create(
+            name='Both tags', author=user, cooking_time=5
+        )
+        both_tags.tags.add(tag, tag2)
+        Recipe.objects.create(name='No tags', author=user, cooking_time=5)
+        ShoppingCart.objects.create(user=user, recipe=both_tags)
+        url = self.urls['recipe_list']
+
+        def get_ids(params):
+            with CaptureQueriesContext(connection) as context:
+                response = self.assert_status_code(
+                    200, user_client.get(url, params), url=url
+                )
+            assert not any(
+                'DISTINCT' in query['sql']
+                for query in context.captured_queries
+            )
+            return [item['id'] for item in response.data['results']]
+
+        assert get_ids({'tags': [tag.slug, tag2.slug]}) == [
+            both_tags.id,
+            recipe.id,
+        ]
+        assert get_ids({'tags': 'unknown'}) == []
+        assert get_ids(
+            {'tags': tag.slug, 'is_favorited': 'true', 'author': user.id}
+        ) == [recipe.id]
+        assert get_ids(
+            {'tags': tag2.slug, 'is_favorited': 'true'}
+        ) == []
+        assert get_ids(
+            {'is_in_shopping_cart': 'true', 'ordering': 'cooking_time'}
+        ) == [both_tags.id]
+        # Словарь тегов берется из кэша, пока теги не изменятся
+        with CaptureQueriesContext(connection) as context:
+            user_client.get(url, {'tags': tag.slug})
+        assert not any(
+            query['sql'].startswith(
+                'SELECT "recipes_tag"."slug", "recipes_tag"."id"'
+            )
+            for query in context.captured_queries
+        )
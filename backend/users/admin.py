@@ -7,7 +7,7 @@ from .models import User
 
 @admin.register(User)
 class UserAdmin(DjangoUserAdmin):
-    readonly_fields = ('date_joined',)
+    readonly_fields = ('date_joined', 'recipes_count', 'subscribers_count')
     list_display = (
         'username',
         'first_name',
@@ -16,6 +16,8 @@ class UserAdmin(DjangoUserAdmin):
         'is_superuser',
         'is_active',
         'date_joined',
+        'recipes_count',
+        'subscribers_count',
     )
     list_filter = ('username', 'email')
     fieldsets = (
@@ -24,7 +26,13 @@ class UserAdmin(DjangoUserAdmin):
             _('Личные данные'),
             {
                 'classes': ('collapse',),
-                'fields': ('first_name', 'last_name', 'date_joined'),
+                'fields': (
+                    'first_name',
+                    'last_name',
+                    'date_joined',
+                    'recipes_count',
+                    'subscribers_count',
+                ),
             },
         ),
         (
@@ -4,6 +4,8 @@ from django.core.exceptions import ValidationError
 from django.db import models
 from django.utils.translation import gettext_lazy as _
 
+from core.models import ExternalFieldsMixin
+
 from .validators import username_validator
 
 ROLE_USER = 'user'
@@ -15,9 +17,11 @@ class UserManager(BaseUserManager):
     """Настройка прав доступа для админов"""
 
 
-class User(AbstractUser):
+class User(ExternalFieldsMixin, AbstractUser):
     """Кастомная модель пользователя"""
 
+    external_fields = ('recipes_count', 'subscribers_count')
+
     username = models.CharField(
         _('username'),
         max_length=settings.USERNAME_LENGTH,
@@ -36,6 +40,14 @@ class User(AbstractUser):
     password = models.CharField(
         _('password'), max_length=settings.USER_PASSWORD_LENGTH
     )
+    # Счетчики поддерживаются сигналами recipes.signals,
+    # пересчитываются командой recount_counters
+    recipes_count = models.PositiveIntegerField(
+        _('Рецептов'), default=0, editable=False
+    )
+    subscribers_count = models.PositiveIntegerField(
+        _('Подписчиков'), default=0, editable=False
+    )
 
     class Meta:
         ordering = ('-id',)
@@ -51,9 +63,10 @@ class Subscription(models.Model):
     MODEL_STRING = '{user} подписан на {another_user}'
     IS_CLEAR = False
 
+    # Индекс по user покрывается уникальным индексом (user, subscription)
     user = models.ForeignKey(
         User, on_delete=models.CASCADE, related_name='subscriptions',
-        verbose_name='Подписчик'
+        verbose_name='Подписчик', db_index=False
     )
     subscription = models.ForeignKey(
         User,